@@ -1,36 +1,291 @@
+import argparse
+import functools
+import itertools
 import re
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Final, Iterable, Iterator, NamedTuple
 
+# Numbers normalized at once by the batch API (and sent to a worker process as one task)
+BATCH_CHUNK_SIZE: Final[int] = 10_000
+# Number of random-looking phones used by the benchmark by default
+BENCHMARK_SIZE: Final[int] = 1_000_000
 
-def normalize_phone(phone_number: str) -> str:
+
+# str.translate() table deleting every Latin-1 character except digits and the plus sign
+PHONE_CLEANUP_TABLE: Final[dict[int, int | None]] = {
+    code: code if chr(code).isdigit() and chr(code).isascii() or chr(code) == '+' else None
+    for code in range(256)
+}
+# Same cleanup as a regular expression, for the rare numbers with other characters left
+PHONE_CLEANUP_PATTERN: Final[re.Pattern] = re.compile(r'[^\d+]')
+
+
+class CountryRule(NamedTuple):
     """
-    Normalizes a user-provided phone number based on specific rules.
+    Numbering rules of one country.
+    """
+    country: str                    # ISO 3166 country code
+    calling_code: str               # international calling code without the plus
+    lengths: tuple[int, ...]        # allowed lengths of the national number
+    trunk_prefix: str = ''          # prefix of numbers dialed inside the country, e.g. '0'
+    operators: dict[str, str] = {}  # operator code (start of the national number) -> operator name
 
-    :param phone_number: raw phone number to normalize.
-    :return: The normalized phone number string.
+
+class ParsedPhone(NamedTuple):
+    number: str                     # normalized number, e.g. '+380501233234'
+    country: str
+    operator: str | None
+
+
+# Adding a country is one more row here: the rules are compiled into PHONE_PREFIX_TRIE below
+COUNTRY_RULES: Final[tuple[CountryRule, ...]] = (
+    CountryRule('UA', '380', (9,), '0', {
+        '39': 'Kyivstar', '50': 'Vodafone', '63': 'lifecell', '66': 'Vodafone', '67': 'Kyivstar',
+        '68': 'Kyivstar', '73': 'lifecell', '91': '3Mob', '92': 'PEOPLEnet', '93': 'lifecell',
+        '94': 'Intertelecom', '95': 'Vodafone', '96': 'Kyivstar', '97': 'Kyivstar', '98': 'Kyivstar',
+        '99': 'Vodafone',
+    }),
+    CountryRule('US', '1', (10,)),
+    CountryRule('GB', '44', (9, 10), '0'),
+    CountryRule('DE', '49', (7, 8, 9, 10, 11), '0'),
+    CountryRule('FR', '33', (9,), '0'),
+    CountryRule('IT', '39', (9, 10)),
+    CountryRule('ES', '34', (9,)),
+    CountryRule('PL', '48', (9,)),
+    CountryRule('CZ', '420', (9,)),
+    CountryRule('SK', '421', (9,), '0'),
+    CountryRule('HU', '36', (8, 9)),
+    CountryRule('RO', '40', (9,), '0'),
+    CountryRule('MD', '373', (8,), '0'),
+    CountryRule('LT', '370', (8,), '8'),
+    CountryRule('LV', '371', (8,)),
+    CountryRule('EE', '372', (7, 8)),
+)
+# Country of the numbers written without the international calling code
+DEFAULT_COUNTRY: Final[str] = 'UA'
+# Key of the trie node entry holding the PrefixMatch of the prefix ending at the node
+TRIE_RULE_KEY: Final[str] = ''
+
+
+class PrefixMatch(NamedTuple):
+    rule: CountryRule
+    operator: str | None
+    full_lengths: frozenset[int]    # allowed lengths of the whole number with the calling code
+
+
+def build_prefix_trie(rules: Iterable[CountryRule]) -> dict:
     """
+    Builds a digit trie of all calling codes and calling code + operator code prefixes.
+    The longest prefix matching a number gives its country and operator in one walk.
+    """
+    trie: dict = {}
+    for rule in rules:
+        full_lengths: frozenset[int] = frozenset(len(rule.calling_code) + length for length in rule.lengths)
+        prefixes: list[tuple[str, str | None]] = [(rule.calling_code, None)]
+        prefixes += [(rule.calling_code + code, operator) for code, operator in rule.operators.items()]
+        for prefix, operator in prefixes:
+            node: dict = trie
+            for digit in prefix:
+                node = node.setdefault(digit, {})
+            node[TRIE_RULE_KEY] = PrefixMatch(rule, operator, full_lengths)
+    return trie
+
 
-    # 1. Strip extra whitespaces (if present)
-    cleaned_phone_number: str = phone_number.strip()
+PHONE_PREFIX_TRIE: Final[dict] = build_prefix_trie(COUNTRY_RULES)
+# Length of the longest prefix in the trie: the country and the operator depend only on this many first digits
+PREFIX_MAX_LENGTH: Final[int] = max(len(rule.calling_code) + max(map(len, rule.operators), default=0)
+                                    for rule in COUNTRY_RULES)
+RULES_BY_COUNTRY: Final[dict[str, CountryRule]] = {rule.country: rule for rule in COUNTRY_RULES}
+DEFAULT_COUNTRY_RULE: Final[CountryRule] = RULES_BY_COUNTRY[DEFAULT_COUNTRY]
 
-    # 2. Remove all extra symbols except digits and the plus sign
-    cleaned_phone_number: str = re.sub(r'[^\d+]', '', cleaned_phone_number)
 
-    # 3. Apply normalization rules from the requirements
+def clean_phone(phone_number: str) -> str:
+    """
+    Removes everything except digits and the plus sign, like re.sub(r'[^\d+]', '', ...) does.
+    """
+    cleaned_phone_number: str = phone_number.translate(PHONE_CLEANUP_TABLE)
+    if not cleaned_phone_number.isascii():
+        # characters outside of the table, e.g. Unicode digits of other scripts
+        cleaned_phone_number = PHONE_CLEANUP_PATTERN.sub('', cleaned_phone_number)
+    return cleaned_phone_number
+
+
+@functools.cache
+def match_prefix(prefix: str) -> PrefixMatch | None:
+    """
+    Walks the trie along the first PREFIX_MAX_LENGTH digits of a number and returns the longest matching prefix.
+    Numbers share a handful of such prefixes, so every walk is done once and then looked up.
+    """
+    node: dict | None = PHONE_PREFIX_TRIE
+    match: PrefixMatch | None = None
+    for digit in prefix:
+        node = node.get(digit)
+        if node is None:
+            break
+        match = node.get(TRIE_RULE_KEY, match)
+    return match
+
+
+def normalize_digits(cleaned_phone_number: str, default_rule: CountryRule) -> tuple[str, CountryRule, str | None] | None:
+    """
+    Finds the country of a cleaned phone number and validates its length.
+
+    :return: (international number without the plus, country rule, operator) or None if the number is invalid.
+    """
+    # Written with '+' or '00' the number is international for sure,
+    # otherwise it is national or just lacks the plus
     if cleaned_phone_number.startswith('+'):
-        # if the number starts with plus - we assume it is correct and complete
-        normalized_number: str = cleaned_phone_number
-    elif cleaned_phone_number.startswith('380'):
-        # if the cleaned number starts with 380 - we only add plus
-        normalized_number: str = '+' + cleaned_phone_number
-    elif cleaned_phone_number.startswith('0'):
-        # if the cleaned number starts with 0,
-        # we assume it is a Ukrainian number and add +38
-        normalized_number: str = '+38' + cleaned_phone_number
+        digits: str = cleaned_phone_number[1:]
+    elif cleaned_phone_number.startswith('00'):
+        digits = cleaned_phone_number[2:]
+    elif default_rule.trunk_prefix and cleaned_phone_number.startswith(default_rule.trunk_prefix):
+        digits = default_rule.calling_code + cleaned_phone_number[len(default_rule.trunk_prefix):]
     else:
+        match = match_prefix(cleaned_phone_number[:PREFIX_MAX_LENGTH])
+        if match is not None and len(cleaned_phone_number) in match.full_lengths:
+            return cleaned_phone_number, match.rule, match.operator
+        # national number of the default country written without the trunk prefix
+        digits = default_rule.calling_code + cleaned_phone_number
+
+    match = match_prefix(digits[:PREFIX_MAX_LENGTH])
+    if match is not None and len(digits) in match.full_lengths:
+        return digits, match.rule, match.operator
+    return None
+
+
+def parse_phone(phone_number: str, default_country: str = DEFAULT_COUNTRY) -> ParsedPhone:
+    """
+    Normalizes a phone number of any supported country and validates its length.
+
+    :param phone_number: raw phone number, with or without the international calling code.
+    :param default_country: country of the numbers written in the national format.
+    :return: the normalized number with its country and mobile operator (when known).
+    :raises ValueError: if the number doesn't fit the rules of any supported country.
+    """
+    result = normalize_digits(clean_phone(phone_number), RULES_BY_COUNTRY[default_country])
+    if result is None:
+        raise ValueError(f"'{phone_number.strip()}' is not a valid phone number of any supported country")
+    digits, rule, operator = result
+    return ParsedPhone('+' + digits, rule.country, operator)
+
+
+def normalize_phone(phone_number: str) -> str:
+    """
+    Normalizes a user-provided phone number of any country from COUNTRY_RULES with parse_phone().
+
+    :param phone_number: raw phone number to normalize.
+    :return: The normalized phone number string, or the cleaned input when it is not valid.
+    """
+    try:
+        return parse_phone(phone_number).number
+    except ValueError:
         # Fallback for other unexpected formats, for robust code
-        normalized_number: str = cleaned_phone_number
+        return clean_phone(phone_number)
 
-    return normalized_number
+
+def normalize_phone_fast(phone_number: str) -> str:
+    """
+    Same as normalize_phone(), for the batch API: the number is cleaned once and
+    the default country rule is looked up once, without building a ParsedPhone.
+
+    :param phone_number: raw phone number to normalize.
+    :return: The normalized phone number string, or the cleaned input when it is not valid.
+    """
+    cleaned_phone_number: str = clean_phone(phone_number)
+    result = normalize_digits(cleaned_phone_number, DEFAULT_COUNTRY_RULE)
+    if result is None:
+        # Fallback for other unexpected formats, like normalize_phone() does
+        return cleaned_phone_number
+    return '+' + result[0]
+
+
+def normalize_chunk(phone_numbers: list[str]) -> list[str]:
+    """
+    Normalizes a list of phone numbers, the unit of work of the batch API.
+    """
+    return [normalize_phone_fast(phone_number) for phone_number in phone_numbers]
+
+
+def iter_chunks(phone_numbers: Iterable[str], chunk_size: int) -> Iterator[list[str]]:
+    """
+    Splits any iterable (e.g. an open file) into lists of chunk_size items without reading it whole.
+    """
+    iterator: Iterator[str] = iter(phone_numbers)
+    while chunk := list(itertools.islice(iterator, chunk_size)):
+        yield chunk
+
+
+def normalize_phones(phone_numbers: Iterable[str], chunk_size: int = BATCH_CHUNK_SIZE,
+                     workers: int = 0) -> Iterator[str]:
+    """
+    Normalizes a stream of phone numbers chunk by chunk and yields the results in the input order.
+
+    :param phone_numbers: any iterable of raw phone numbers, e.g. lines of an open file.
+    :param chunk_size: how many numbers are normalized at once.
+    :param workers: number of worker processes, 0 or 1 normalizes in the current process.
+    :return: iterator of the normalized phone numbers.
+    """
+    chunks: Iterator[list[str]] = iter_chunks(phone_numbers, chunk_size)
+
+    if workers <= 1:
+        for chunk in chunks:
+            yield from normalize_chunk(chunk)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Only a few chunks per worker are in flight, so the input is read
+        # as fast as it is normalized and the memory use stays flat
+        pending: deque[Future] = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(normalize_chunk, chunk))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def normalize_phone_file(input_path: str, output_path: str, chunk_size: int = BATCH_CHUNK_SIZE,
+                         workers: int = 0) -> int:
+    """
+    Normalizes a file with one raw phone number per line into another file.
+
+    :return: the number of normalized phone numbers.
+    """
+    count: int = 0
+    with open(input_path, "r", encoding="utf-8") as input_file, \
+            open(output_path, "w", encoding="utf-8") as output_file:
+        for chunk in iter_chunks(normalize_phones(input_file, chunk_size, workers), chunk_size):
+            output_file.write("\n".join(chunk) + "\n")
+            count += len(chunk)
+    return count
+
+
+def benchmark_normalizers(size: int = BENCHMARK_SIZE, workers: int = 4) -> None:
+    """
+    Compares the per-call normalize_phone() with the batch API on generated phone numbers.
+    """
+    templates: list[str] = ["    +38(050)123-{:02d}-{:02d}", "067\t123 {:02d}{:02d}", "38050-111-{:02d}-{:02d}",
+                            "(095) 234-{:02d}{:02d}\n", "+380 44 123 {:02d}{:02d}"]
+    phone_numbers: list[str] = [templates[i % len(templates)].format(i // 100 % 100, i % 100) for i in range(size)]
+
+    def measure(normalize) -> float:
+        start: float = time.perf_counter()
+        normalize()
+        return time.perf_counter() - start
+
+    results: list[tuple[str, float]] = [
+        ("normalize_phone() per call", measure(lambda: [normalize_phone(phone) for phone in phone_numbers])),
+        ("normalize_phones() batch", measure(lambda: list(normalize_phones(phone_numbers)))),
+        (f"normalize_phones() {workers} processes", measure(lambda: list(normalize_phones(phone_numbers, workers=workers)))),
+    ]
+
+    print(f"Normalizing {size} phone numbers:")
+    print("-" * 56)
+    for name, seconds in results:
+        print(f"{name:<36} | {seconds:>6.3f} s | {size / seconds / 1e6:>5.2f} M/s")
 
 
 def test_normalize_phone(phone_list: list) -> None:
@@ -40,9 +295,12 @@ def test_normalize_phone(phone_list: list) -> None:
 
     all_tests_passed: bool = True
 
-    for provided, expected in phone_list:
+    batch_normalized: list[str] = list(normalize_phones((provided for provided, _ in phone_list), chunk_size=2))
+
+    for (provided, expected), batch_result in zip(phone_list, batch_normalized):
         normalized: str = normalize_phone(provided)
-        passed: bool = normalized == expected
+        # the batch API has to agree with the reference function
+        passed: bool = normalized == expected and batch_result == expected
         status: str = "✅ PASSED" if passed else "❌ FAILED"
 
         if not passed:
@@ -60,7 +318,88 @@ def test_normalize_phone(phone_list: list) -> None:
     else:
         print("\nSome tests failed. 🛑")
 
+def test_parse_phone(phone_list: list) -> None:
+    """
+    Runs the validation examples for the parse_phone function, None means the number is invalid.
+    """
+    all_tests_passed: bool = True
+
+    for provided, expected_number, expected_country, expected_operator in phone_list:
+        try:
+            actual: ParsedPhone | None = parse_phone(provided)
+        except ValueError:
+            actual = None
+        expected: ParsedPhone | None = None
+        if expected_number is not None:
+            expected = ParsedPhone(expected_number, expected_country, expected_operator)
+        passed: bool = actual == expected
+        status: str = "✅ PASSED" if passed else "❌ FAILED"
+
+        if not passed:
+            all_tests_passed = False
+
+        print(f"Provided:   '{provided}'")
+        print(f"Expected:   {expected}")
+        print(f"Actual:     {actual}")
+        print(f"Result:     {status}")
+        print("-" * 30)
+
+    if all_tests_passed:
+        print("\nAll tests passed successfully! 🎉")
+    else:
+        print("\nSome tests failed. 🛑")
+
+
+def parse_cmd_args() -> argparse.Namespace:
+    """
+    Parses command-line arguments: without them the self-tests are run.
+    """
+    parser = argparse.ArgumentParser(description="Normalizes phone numbers to the international E.164 format, e.g. +380501234567.")
+    parser.add_argument(
+        '--input',
+        metavar='FILE',
+        help='Normalize phone numbers from FILE (one per line) instead of running the self-tests.'
+    )
+    parser.add_argument(
+        '--output',
+        metavar='FILE',
+        help='Where the normalized phone numbers are written (default: standard output).'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=0,
+        metavar='N',
+        help='Number of worker processes for the batch normalization (default: none).'
+    )
+    parser.add_argument(
+        '--benchmark',
+        nargs='?',
+        type=int,
+        const=BENCHMARK_SIZE,
+        metavar='SIZE',
+        help=f'Compare the per-call and the batch normalization on SIZE numbers (default {BENCHMARK_SIZE}).'
+    )
+    return parser.parse_args()
+
+
 def main() -> None:
+    args = parse_cmd_args()
+
+    if args.benchmark:
+        benchmark_normalizers(args.benchmark, args.workers or 4)
+        return
+
+    if args.input:
+        if args.output:
+            count: int = normalize_phone_file(args.input, args.output, workers=args.workers)
+            print(f"{count} phone numbers were normalized into '{args.output}'.")
+        else:
+            with open(args.input, "r", encoding="utf-8") as input_file:
+                for chunk in iter_chunks(normalize_phones(input_file, workers=args.workers), BATCH_CHUNK_SIZE):
+                    sys.stdout.write("\n".join(chunk) + "\n")
+        return
+
     # first set of phone numbers from the task description section
     phone_numbers_1 = [
         ("    +38(050)123-32-34",   "+380501233234"),
@@ -83,9 +422,22 @@ def main() -> None:
         ("38050 111 22 11   ",      "+380501112211"),
     ]
 
+    # mixed international list for the country rules: (provided, expected number, country, operator)
+    international_phone_numbers = [
+        ("+38 (067) 123-45-67",     "+380671234567", "UA", "Kyivstar"),
+        ("0931234567",              "+380931234567", "UA", "lifecell"),
+        ("00 48 601 234 567",       "+48601234567",  "PL", None),
+        ("+1 (212) 555-0123",       "+12125550123",  "US", None),
+        ("+44 20 7946 0958",        "+442079460958", "GB", None),
+        ("+420 601 123 456",        "+420601123456", "CZ", None),
+        ("373 69 123 456",          "+37369123456",  "MD", None),
+        ("+380 50 123",             None,            None, None),
+    ]
+
     # run the tests
     test_normalize_phone(phone_numbers_1)
     test_normalize_phone(phone_numbers_2)
+    test_parse_phone(international_phone_numbers)
 
 
 if __name__ == "__main__":
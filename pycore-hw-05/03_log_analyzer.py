@@ -1,22 +1,268 @@
 import argparse
+import bisect
+import bz2
+import csv
+import glob
+import gzip
+import hashlib
+import heapq
+import json
+import lzma
+import mmap
+import os
+import re
+import shutil
 import sys
-from typing import Final
+import tempfile
+import time
+from collections import Counter, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Final, Iterable, Iterator, NamedTuple, TextIO
 
 # Only lines with these log levels will be counted and
 # printed (if allowed), other levels will be ignored and skipped
 SUPPORTED_LOG_LEVELS: Final[list[str]] = ["INFO", "DEBUG", "WARNING", "ERROR"]
 
-def parse_cmd_args() -> tuple[str, list[str]]:
+# The file is split into byte ranges of about this size, each counted by one worker process
+DEFAULT_CHUNK_SIZE_MB: Final[int] = 64
+
+# Compressed logs are decompressed on the fly, in blocks of this size
+STREAM_BLOCK_SIZE: Final[int] = 16 * 1024 * 1024
+COMPRESSED_LOG_OPENERS: Final[dict[str, Callable]] = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}
+# A worker keeps up to this many bytes of the lines to print of a compressed log in memory,
+# the rest is spilled to a temporary file that the main process copies to the output
+COMPRESSED_LINES_IN_MEMORY_SIZE: Final[int] = STREAM_BLOCK_SIZE
+
+# In the follow mode the file is checked for new lines this often, in seconds
+FOLLOW_POLL_INTERVAL: Final[float] = 0.25
+# and the counters table is refreshed this often by default, in seconds
+DEFAULT_REFRESH_INTERVAL: Final[float] = 2.0
+# ANSI sequence moving the cursor home and clearing the terminal
+CLEAR_SCREEN: Final[str] = "\033[H\033[J"
+
+# Level is the third token of a line: "2024-01-22 08:30:01 INFO User logged in successfully."
+# The patterns run over the memory-mapped bytes, so lines are never split or decoded one by one
+LOG_LEVEL_PATTERN: Final[re.Pattern] = re.compile(rb'^[ \t]*\S+[ \t]+\S+[ \t]+(\S+)', re.MULTILINE)
+# Same, but also captures the whole line (without the leading blanks) and the message after the level,
+# for the lines that have to be printed or filtered
+LOG_LINE_PATTERN: Final[re.Pattern] = re.compile(
+    rb'^[ \t]*(\S+[ \t]+\S+[ \t]+(\S+)[ \t]*([^\n]*))', re.MULTILINE
+)
+# Structured form of a line: date, time (fractions of a second are ignored), level and message
+LOG_RECORD_PATTERN: Final[re.Pattern] = re.compile(
+    rb'^[ \t]*(\d{4}-\d{2}-\d{2})[ T](\d{2}:\d{2}:\d{2})\S*[ \t]+(\S+)[ \t]*([^\n]*)', re.MULTILINE
+)
+TIMESTAMP_FORMAT: Final[str] = "%Y-%m-%d %H:%M:%S"
+# Formats accepted by --since and --until
+TIME_ARGUMENT_FORMATS: Final[list[str]] = ["%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"]
+
+# Length of the timestamp prefix naming a histogram bucket
+HISTOGRAM_BUCKET_KEY_LENGTHS: Final[dict[str, int]] = {"minute": 16, "hour": 13}
+HISTOGRAM_BAR_WIDTH: Final[int] = 40
+# The top templates are tracked with this many counters per requested template
+TOP_TEMPLATES_CAPACITY_FACTOR: Final[int] = 10
+# Templates are counted exactly for this many lines, then folded into the bounded summary
+TEMPLATE_BLOCK_LINES: Final[int] = 100_000
+# Variable parts of the messages masked to get their templates, applied in this order
+MESSAGE_MASKS: Final[list[tuple[re.Pattern, str]]] = [
+    (re.compile(r'"[^"]*"|\'[^\']*\''), '<STR>'),
+    (re.compile(r'\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b'), '<UUID>'),
+    (re.compile(r'\b\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?\b'), '<IP>'),
+    (re.compile(r'\b(?:0x[0-9a-fA-F]+|(?=[0-9a-fA-F]*[a-fA-F])(?=[0-9a-fA-F]*\d)[0-9a-fA-F]{8,})\b'), '<HEX>'),
+    (re.compile(r'\d+(?:\.\d+)?'), '<N>'),
+]
+
+# Filters search the whole chunk for the wanted messages, unless the first matches show
+# that fewer than 1 in DENSE_MATCHES_LINE_RATIO lines is skipped between them
+DENSE_MATCHES_SAMPLE: Final[int] = 1000
+DENSE_MATCHES_LINE_RATIO: Final[int] = 4
+# Patterns that may match a message alone but not inside its line, which rules out searching the whole chunk:
+# anchors to the start or the end of the string (inside a chunk "\Z" matches only at its very end) and lookbehinds
+LINE_CONTEXT_PATTERN: Final[re.Pattern] = re.compile(r'\^|\\[AZz]|\(\?<')
+
+# Matching lines are written to the standard output in blocks of at least this size
+OUTPUT_BUFFER_SIZE: Final[int] = 1024 * 1024
+PROMETHEUS_METRIC_PREFIX: Final[str] = "log_analyzer"
+
+# Sidecar index of a log: '<log file>.idx' with per-minute buckets, sorted by their keys
+INDEX_SUFFIX: Final[str] = ".idx"
+INDEX_VERSION: Final[int] = 2
+# Length of the timestamp prefix naming a bucket: "2024-01-22 08:30"
+INDEX_BUCKET_KEY_LENGTH: Final[int] = 16
+INDEX_BUCKET_FORMAT: Final[str] = "%Y-%m-%d %H:%M"
+# The beginning of the log is hashed to tell an appended log from a replaced one
+INDEX_HEAD_SIZE: Final[int] = 4096
+
+class LogRecord(NamedTuple):
+    """
+    One parsed log line. Timestamps keep the text form, which sorts like the time itself.
+    """
+    timestamp: str  # "2024-01-22 08:30:01"
+    level: str      # uppercased
+    message: str
+    offset: int     # byte range of the line in the file
+    end: int
+
+class MessageFilter:
+    """
+    Filter of the messages by --grep, --keyword and --exclude, compiled into one combined pattern
+    of the wanted messages and one of the unwanted ones, so every message is scanned at most twice
+    whatever the number of the filters. The keywords are merged into a trie, so the regex engine
+    follows the common prefixes once instead of trying every keyword at every position.
+    Both patterns are compiled for bytes (lines scanned without decoding) and for str (parsed records).
+    """
+    def __init__(self, grep_patterns: list[str], keywords: list[str], exclude_patterns: list[str],
+                 ignore_case: bool = False):
+        # Messages have no newlines, MULTILINE only makes "$" match at the line ends when a chunk is searched
+        flags: int = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+        alternatives: list[str] = [f"(?:{pattern})" for pattern in grep_patterns]
+        if keywords:
+            alternatives.append(keywords_regex(keywords))
+        include_source: str | None = "|".join(alternatives) if alternatives else None
+        exclude_source: str | None = "|".join(f"(?:{pattern})" for pattern in exclude_patterns) or None
+        self.include: tuple[re.Pattern, re.Pattern] | None = (
+            (re.compile(include_source.encode(), flags), re.compile(include_source, flags))
+            if include_source else None
+        )
+        # Whether the lines with the wanted messages can be found by searching the whole chunk
+        self.searchable: bool = include_source is not None and not any(
+            LINE_CONTEXT_PATTERN.search(pattern) for pattern in grep_patterns)
+        self.exclude: tuple[re.Pattern, re.Pattern] | None = (
+            (re.compile(exclude_source.encode(), flags), re.compile(exclude_source, flags))
+            if exclude_source else None
+        )
+
+    def matches(self, message: bytes | str) -> bool:
+        kind: int = 1 if isinstance(message, str) else 0
+        if self.include is not None and self.include[kind].search(message) is None:
+            return False
+        return self.exclude is None or self.exclude[kind].search(message) is None
+
+def keywords_regex(keywords: list[str]) -> str:
+    """
+    Builds a regex matching any of the keywords from their prefix trie,
+    e.g. ["time", "timeout", "tick"] gives "ti(?:ck|me(?:out)?)".
+    """
+    trie: dict = {}
+    for keyword in keywords:
+        node: dict = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[""] = {} # end of a keyword
+
+    def node_regex(node: dict) -> str:
+        branches: list[str] = [re.escape(char) + node_regex(child) for char, child in sorted(node.items()) if char]
+        optional: bool = "" in node
+        if not branches:
+            return ""
+        if len(branches) == 1 and not optional:
+            return branches[0]
+        return "(?:" + "|".join(branches) + ")" + ("?" if optional else "")
+
+    return node_regex(trie)
+
+class SpaceSaving:
+    """
+    Bounded summary of the most frequent items of a stream in at most `capacity` counters
+    (Space-Saving, Metwally et al.). Counts are upper bounds, too high by at most the item's error.
+    Summaries of different parts of the stream are merged as described in "Mergeable Summaries"
+    (Agarwal et al.), so every worker process summarizes only its own part.
+    """
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.counters: dict = {} # item -> [count, error]
+
+    def min_count(self) -> int:
+        # Count of an item that is not in the summary is at most this
+        return min(count for count, _ in self.counters.values()) if len(self.counters) >= self.capacity else 0
+
+    def merge(self, other_counters: dict, other_min_count: int = 0) -> None:
+        """
+        Merges the counters of another summary, or exact counts ({item: [count, 0]}, other_min_count 0).
+        """
+        own_min_count: int = self.min_count()
+        merged: dict = {}
+        for item in self.counters.keys() | other_counters.keys():
+            own_count, own_error = self.counters.get(item, (own_min_count, own_min_count))
+            other_count, other_error = other_counters.get(item, (other_min_count, other_min_count))
+            merged[item] = [own_count + other_count, own_error + other_error]
+        if len(merged) > self.capacity:
+            merged = dict(heapq.nlargest(self.capacity, merged.items(), key=lambda item: item[1][0]))
+        self.counters = merged
+
+    def top(self, n: int) -> list[tuple]:
+        """
+        Returns the n most frequent (item, count, error) tuples.
+        """
+        return [(item, count, error) for item, (count, error)
+                in heapq.nlargest(n, self.counters.items(), key=lambda item: item[1][0])]
+
+def message_template(message: str) -> str:
+    """
+    Masks numbers, IDs, addresses and quoted strings, so messages differing only in them are counted together.
+    """
+    for pattern, replacement in MESSAGE_MASKS:
+        message = pattern.sub(replacement, message)
+    return message
+
+class LogStats:
+    """
+    Per-level histogram over time buckets and the top message templates of a part of the log.
+    The stats of the parts are merged, so the memory depends on the number of buckets
+    and the summary capacity, not on the size of the log.
+    """
+    def __init__(self, bucket_key_length: int = 0, top_capacity: int = 0):
+        self.bucket_key_length = bucket_key_length
+        self.histogram: dict[str, Counter] = {} # bucket -> level counter
+        self.templates = SpaceSaving(top_capacity) if top_capacity else None
+        self._block_templates: Counter = Counter() # exact counts of the current block
+
+    def add(self, record: LogRecord) -> None:
+        if self.bucket_key_length:
+            bucket_key: str = record.timestamp[:self.bucket_key_length]
+            bucket: Counter | None = self.histogram.get(bucket_key)
+            if bucket is None:
+                bucket = self.histogram[bucket_key] = Counter()
+            bucket[record.level] += 1
+        if self.templates is not None:
+            self._block_templates[(record.level, message_template(record.message))] += 1
+            if self._block_templates.total() >= TEMPLATE_BLOCK_LINES:
+                self.flush()
+
+    def flush(self) -> None:
+        if self._block_templates:
+            self.templates.merge({item: [count, 0] for item, count in self._block_templates.items()})
+            self._block_templates.clear()
+
+    def merge(self, other: 'LogStats') -> None:
+        for bucket_key, level_counts in other.histogram.items():
+            self.histogram.setdefault(bucket_key, Counter()).update(level_counts)
+        if self.templates is not None and other.templates is not None:
+            other.flush()
+            self.templates.merge(other.templates.counters, other.templates.min_count())
+
+    def __getstate__(self) -> dict:
+        # Sent back from the worker processes with the current block folded into the summary
+        if self.templates is not None:
+            self.flush()
+        return self.__dict__
+
+def parse_cmd_args() -> argparse.Namespace:
     """
     Parses command-line arguments for a log file name and optional log levels.
     """
     parser = argparse.ArgumentParser()
 
-    # Add the mandatory positional argument (file name)
+    # Add the mandatory positional argument (file names)
     parser.add_argument(
-        'filename',
-        type=str,
-        help='The path and name of the log file to process.'
+        'filenames',
+        nargs='+',
+        metavar='PATH',
+        help=(
+            'Log files to process: file names, glob patterns (e.g. "logs/*.log.gz", "**" for subdirectories) '
+            'or directories. Files compressed with gzip, bzip2 or xz are read without unpacking them to disk.'
+        )
     )
 
     # Add the optional argument for log levels
@@ -32,6 +278,118 @@ def parse_cmd_args() -> tuple[str, list[str]]:
         )
     )
 
+    # Add the optional arguments for filtering the lines by their messages
+    parser.add_argument(
+        '--grep',
+        action='append',
+        default=[],
+        metavar='REGEX',
+        help='Only count and show the lines whose message matches REGEX (may be repeated, any of them matches).'
+    )
+    parser.add_argument(
+        '--keyword',
+        action='append',
+        default=[],
+        metavar='WORD',
+        help='Only count and show the lines whose message contains WORD (may be repeated, combined with --grep).'
+    )
+    parser.add_argument(
+        '--exclude',
+        action='append',
+        default=[],
+        metavar='REGEX',
+        help='Skip the lines whose message matches REGEX (may be repeated).'
+    )
+    parser.add_argument(
+        '--ignore-case',
+        action='store_true',
+        help='Match --grep, --keyword and --exclude ignoring the case.'
+    )
+
+    # Add the optional arguments for the parallel processing of big files
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=os.cpu_count() or 1,
+        metavar='N',
+        help='Number of processes counting the file chunks (default: number of CPUs).'
+    )
+    parser.add_argument(
+        '--chunk-size',
+        type=int,
+        default=DEFAULT_CHUNK_SIZE_MB,
+        metavar='MB',
+        help=f'Size of the file chunk counted by one process, in megabytes (default: {DEFAULT_CHUNK_SIZE_MB}).'
+    )
+
+    # Add the optional arguments for watching a growing log
+    parser.add_argument(
+        '--follow',
+        action='store_true',
+        help='Keep watching the file for new lines (like tail -f) until Ctrl+C, following rotations.'
+    )
+    parser.add_argument(
+        '--interval',
+        type=float,
+        default=DEFAULT_REFRESH_INTERVAL,
+        metavar='SECONDS',
+        help=f'How often the counters are refreshed in the follow mode (default: {DEFAULT_REFRESH_INTERVAL:g}).'
+    )
+
+    # Add the optional arguments for the detailed reports
+    parser.add_argument(
+        '--histogram',
+        choices=HISTOGRAM_BUCKET_KEY_LENGTHS.keys(),
+        help='Also print the counts of every level per minute or per hour.'
+    )
+    parser.add_argument(
+        '--top',
+        type=int,
+        default=0,
+        metavar='N',
+        help='Also print the N most frequent message templates (numbers, IDs and addresses masked).'
+    )
+
+    # Add the optional arguments for the report output
+    parser.add_argument(
+        '--format',
+        choices=REPORT_WRITERS.keys(),
+        default='text',
+        help='Format of the report: a text table (default), JSON, CSV or Prometheus text exposition format.'
+    )
+    parser.add_argument(
+        '--output',
+        metavar='FILE',
+        help=(
+            'Write the report to FILE (replaced atomically) instead of the standard output. '
+            'Lines shown with --levels still go to the standard output. '
+            'In the follow mode the file is rewritten at every refresh.'
+        )
+    )
+
+    # Add the optional arguments for the time-range queries
+    parser.add_argument(
+        '--since',
+        type=parse_time_argument,
+        metavar='TIME',
+        help='Only count lines logged at or after TIME ("YYYY-MM-DD[ HH:MM[:SS]]").'
+    )
+    parser.add_argument(
+        '--until',
+        type=parse_time_argument,
+        metavar='TIME',
+        help='Only count lines logged before TIME ("YYYY-MM-DD[ HH:MM[:SS]]").'
+    )
+    parser.add_argument(
+        '--index',
+        action='store_true',
+        help=(
+            f'Build or update the sidecar index (<file>{INDEX_SUFFIX}) with per-minute level counts '
+            'and use it, so repeated time-range queries do not rescan the whole log. '
+            'Lines without a timestamp are not indexed.'
+        )
+    )
+
     # Parse and return the arguments
     try:
         args = parser.parse_args()
@@ -39,53 +397,765 @@ def parse_cmd_args() -> tuple[str, list[str]]:
         print(f"An error occurred during argument parsing: {e}", file=sys.stderr)
         sys.exit(1)
 
-    return args.filename, args.levels
+    return args
+
+def parse_time_argument(value: str) -> str:
+    """
+    Converts a --since/--until value into the timestamp form used by the log lines.
+    """
+    for time_format in TIME_ARGUMENT_FORMATS:
+        try:
+            return datetime.strptime(value, time_format).strftime(TIMESTAMP_FORMAT)
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError(f"invalid time '{value}', use YYYY-MM-DD[ HH:MM[:SS]]")
 
 def validate_log_levels(levels_to_print: list[str]) -> list[str]:
     """
     Validates user provided log levels against SUPPORTED_LOG_LEVELS.
     Removes unsupported levels if they found
     """
-    if levels_to_print in SUPPORTED_LOG_LEVELS:
+    levels_to_print = [level.upper() for level in levels_to_print]
+    unsupported_levels = set(levels_to_print) - set(SUPPORTED_LOG_LEVELS)
+    if not unsupported_levels:
         return levels_to_print
     else:
-        unsupported_levels = set(levels_to_print) - set(SUPPORTED_LOG_LEVELS)
         print(f"Warning: Unsupported log levels provided: {', '.join(unsupported_levels)} \n")
         return list(set(SUPPORTED_LOG_LEVELS) & set(levels_to_print))
 
-def pretty_print_counters(level_counter):
+def pretty_print_counters(level_counter, rates=None, file=None):
     """
     Prints the counters into a formatted table, sorting them in descending order.
+    When rates (lines per second of every level) are given, they are printed as one more column.
     """
-    print(f"\n{'Log level':<10} | {'Count':<5}")
-    print("-" * 20)
+    if rates is None:
+        print(f"\n{'Log level':<10} | {'Count':<5}", file=file)
+        print("-" * 20, file=file)
+    else:
+        print(f"\n{'Log level':<10} | {'Count':<10} | {'Per second':>10}", file=file)
+        print("-" * 36, file=file)
     for level, count in sorted(level_counter.items(), key=lambda x: x[1], reverse=True):
         if count > 0:
-            print(f"{level:<10} | {count:<5}")
+            if rates is None:
+                print(f"{level:<10} | {count:<5}", file=file)
+            else:
+                print(f"{level:<10} | {count:<10} | {rates.get(level, 0):>10.1f}", file=file)
+
+def print_histogram(stats: LogStats, file: TextIO | None = None) -> None:
+    """
+    Prints the per-level counts of every time bucket with a bar of the bucket's total.
+    """
+    if not stats.histogram:
+        return
+    max_total: int = max(sum(counts[level] for level in SUPPORTED_LOG_LEVELS) for counts in stats.histogram.values())
+    print(f"\n{'Time':<16} | " + " | ".join(f"{level:>7}" for level in SUPPORTED_LOG_LEVELS), file=file)
+    print("-" * (16 + 10 * len(SUPPORTED_LOG_LEVELS)), file=file)
+    for bucket_key in sorted(stats.histogram):
+        counts: Counter = stats.histogram[bucket_key]
+        total: int = sum(counts[level] for level in SUPPORTED_LOG_LEVELS)
+        bar: str = "█" * round(HISTOGRAM_BAR_WIDTH * total / max_total) if max_total else ""
+        print(f"{bucket_key:<16} | " + " | ".join(f"{counts[level]:>7}" for level in SUPPORTED_LOG_LEVELS)
+              + f" | {bar}", file=file)
+
+def get_top_templates(stats: LogStats, top: int) -> list[tuple[str, str, int, int]]:
+    """
+    Returns the `top` most frequent (level, message template, count, error) of the supported levels.
+    """
+    stats.flush()
+    return [(level, template, count, error)
+            for (level, template), count, error in stats.templates.top(len(stats.templates.counters))
+            if level in SUPPORTED_LOG_LEVELS][:top]
+
+def print_top_templates(stats: LogStats, top: int, file: TextIO | None = None) -> None:
+    """
+    Prints the most frequent message templates; counts that may be overestimated are marked with '±error'.
+    """
+    top_templates: list[tuple[str, str, int, int]] = get_top_templates(stats, top)
+    if not top_templates:
+        return
+    print(f"\n{'Count':>14} | {'Log level':<10} | Message template", file=file)
+    print("-" * 60, file=file)
+    for level, template, count, error in top_templates:
+        count_text: str = f"{count}±{error}" if error else str(count)
+        print(f"{count_text:>14} | {level:<10} | {template}", file=file)
+
+def write_text_report(report_file: TextIO, level_counter: dict[str, int], stats: LogStats | None, top: int) -> None:
+    pretty_print_counters(level_counter, file=report_file)
+    if stats is not None:
+        print_histogram(stats, report_file)
+        if top > 0:
+            print_top_templates(stats, top, report_file)
+
+def write_json_report(report_file: TextIO, level_counter: dict[str, int], stats: LogStats | None, top: int) -> None:
+    report: dict = {"levels": dict(sorted(level_counter.items(), key=lambda x: x[1], reverse=True))}
+    if stats is not None and stats.histogram:
+        report["histogram"] = {
+            bucket_key: {level: stats.histogram[bucket_key][level] for level in SUPPORTED_LOG_LEVELS}
+            for bucket_key in sorted(stats.histogram)
+        }
+    if stats is not None and top > 0:
+        report["top_templates"] = [
+            {"level": level, "template": template, "count": count, "error": error}
+            for level, template, count, error in get_top_templates(stats, top)
+        ]
+    json.dump(report, report_file, ensure_ascii=False, indent=2)
+    report_file.write("\n")
+
+def write_csv_report(report_file: TextIO, level_counter: dict[str, int], stats: LogStats | None, top: int) -> None:
+    # One table for all the sections: the columns a section does not use are left empty
+    writer = csv.writer(report_file)
+    writer.writerow(["section", "time", "level", "template", "count", "error"])
+    for level, count in sorted(level_counter.items(), key=lambda x: x[1], reverse=True):
+        writer.writerow(["levels", "", level, "", count, ""])
+    if stats is not None:
+        for bucket_key in sorted(stats.histogram):
+            for level in SUPPORTED_LOG_LEVELS:
+                writer.writerow(["histogram", bucket_key, level, "", stats.histogram[bucket_key][level], ""])
+        if top > 0:
+            for level, template, count, error in get_top_templates(stats, top):
+                writer.writerow(["top_templates", "", level, template, count, error])
+
+def prometheus_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def write_prometheus_report(report_file: TextIO, level_counter: dict[str, int], stats: LogStats | None,
+                            top: int) -> None:
+    """
+    Writes the counters in the Prometheus text exposition format, e.g. for the node_exporter textfile collector.
+    The histogram is not exported: a label per minute would create a new time series every minute.
+    """
+    lines: list[str] = [
+        f"# HELP {PROMETHEUS_METRIC_PREFIX}_lines Log lines of every level.",
+        f"# TYPE {PROMETHEUS_METRIC_PREFIX}_lines gauge",
+    ]
+    lines += [f'{PROMETHEUS_METRIC_PREFIX}_lines{{level="{prometheus_label(level)}"}} {count}'
+              for level, count in sorted(level_counter.items(), key=lambda x: x[1], reverse=True)]
+    if stats is not None and top > 0:
+        lines += [
+            f"# HELP {PROMETHEUS_METRIC_PREFIX}_template_lines Log lines of the most frequent message templates.",
+            f"# TYPE {PROMETHEUS_METRIC_PREFIX}_template_lines gauge",
+        ]
+        lines += [f'{PROMETHEUS_METRIC_PREFIX}_template_lines{{level="{prometheus_label(level)}",'
+                  f'template="{prometheus_label(template)}"}} {count}'
+                  for level, template, count, _ in get_top_templates(stats, top)]
+    report_file.write("\n".join(lines) + "\n")
+
+REPORT_WRITERS: Final[dict[str, Callable]] = {
+    "text": write_text_report,
+    "json": write_json_report,
+    "csv": write_csv_report,
+    "prometheus": write_prometheus_report,
+}
+
+def write_report(output_format: str, output_path: str | None, level_counter: dict[str, int],
+                 stats: LogStats | None = None, top: int = 0) -> None:
+    """
+    Writes the report in the format to the standard output or to the file at output_path.
+    The file is replaced atomically, so a dashboard or a collector never reads a half-written report.
+    """
+    write: Callable = REPORT_WRITERS[output_format]
+    if output_path is None:
+        write(sys.stdout, level_counter, stats, top)
+        sys.stdout.flush()
+        return
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(output_path)),
+                                     prefix=os.path.basename(output_path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="" if output_format == "csv" else None) as report_file:
+            write(report_file, level_counter, stats, top)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, output_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+class LineWriter:
+    """
+    Writes the matching lines to the standard output as they are, in blocks of at least OUTPUT_BUFFER_SIZE bytes,
+    so printing most of a big log costs a few big writes instead of a print() per line.
+    """
+    def __init__(self, buffer_size: int = OUTPUT_BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self.blocks: list[bytes] = []
+        self.size: int = 0
+
+    def write(self, lines: bytes) -> None:
+        self.blocks.append(lines)
+        self.size += len(lines)
+        if self.size >= self.buffer_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.blocks:
+            sys.stdout.flush() # the text printed before the lines
+            sys.stdout.buffer.write(b"".join(self.blocks))
+            sys.stdout.buffer.flush()
+            self.blocks.clear()
+            self.size = 0
+
+    def write_file(self, path: str) -> None:
+        """
+        Copies the lines stored in the file to the standard output, block by block.
+        """
+        self.flush()
+        with open(path, "rb") as lines_file:
+            shutil.copyfileobj(lines_file, sys.stdout.buffer, OUTPUT_BUFFER_SIZE)
+        sys.stdout.buffer.flush()
+
+line_writer = LineWriter()
+
+def expand_log_paths(paths: list[str]) -> list[str]:
+    """
+    Turns the file names, glob patterns and directories into a list of log files.
+    Directories are walked recursively; sidecar index files are skipped.
+    """
+    log_file_names: list[str] = []
+    for path in paths:
+        if os.path.isdir(path):
+            matches: list[str] = sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+        elif any(symbol in path for symbol in "*?["):
+            matches = sorted(match for match in glob.glob(path, recursive=True) if os.path.isfile(match))
+            if not matches:
+                raise FileNotFoundError(2, "No files match the pattern", path)
+        else:
+            matches = [path] # a missing file is reported when it is opened
+        for match in matches:
+            if not match.endswith(INDEX_SUFFIX) and match not in log_file_names:
+                log_file_names.append(match)
+    return log_file_names
+
+def is_compressed(log_file_name: str) -> bool:
+    return os.path.splitext(log_file_name)[1].lower() in COMPRESSED_LOG_OPENERS
+
+def split_into_chunks(log_file_name: str, chunk_size: int,
+                      complete_lines_only: bool = False, first_offset: int = 0) -> list[tuple[int, int]]:
+    """
+    Splits the file from first_offset (a line start) into (start, end) byte ranges of about
+    chunk_size bytes. Every range ends right after a newline, so no line is cut between two chunks.
+    With complete_lines_only the last line is skipped if it doesn't end with
+    a newline yet, e.g. because it is still being written.
+    """
+    chunks: list[tuple[int, int]] = []
+    with open(log_file_name, "rb") as log_file:
+        file_size: int = os.fstat(log_file.fileno()).st_size
+        if file_size == 0:
+            return chunks # an empty file can't be memory-mapped
+        with mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if complete_lines_only:
+                file_size = data.rfind(b"\n") + 1
+            start: int = first_offset
+            while start < file_size:
+                end: int = data.find(b"\n", min(start + chunk_size, file_size) - 1)
+                end = file_size if end == -1 else end + 1
+                chunks.append((start, end))
+                start = end
+    return chunks
+
+def iter_log_records(data, start: int, end: int) -> Iterator[LogRecord]:
+    """
+    Parses the lines in data[start:end] (bytes or a memory map) into LogRecords.
+    Lines without a timestamp and a level are skipped.
+    """
+    for match in LOG_RECORD_PATTERN.finditer(data, start, end):
+        log_date, log_time, level, message = match.groups()
+        yield LogRecord(f"{log_date.decode()} {log_time.decode()}", level.decode(errors="replace").upper(),
+                        message.decode(errors="replace").rstrip(), match.start(), match.end())
+
+def iter_lines_around_matches(data, start: int, end: int,
+                              pattern: re.Pattern) -> Iterator[tuple[bytes, bytes, bytes]]:
+    """
+    Searches data[start:end] for the pattern as a whole, like grep, and yields the (line, level, message)
+    groups of LOG_LINE_PATTERN for every line holding a match. The match may lie outside of the message
+    (or span lines), so the caller checks the message itself again.
+    When most lines match, jumping from match to match costs more than parsing every line,
+    so after a sample of matches the rest is parsed line by line.
+    """
+    position: int = start
+    matched_lines: int = 0
+    matched_size: int = 0
+    while (found := pattern.search(data, position, end)) is not None:
+        if matched_lines == DENSE_MATCHES_SAMPLE:
+            if (position - start) < DENSE_MATCHES_LINE_RATIO * matched_size:
+                yield from LOG_LINE_PATTERN.findall(data, position, end)
+                return
+        matched_lines += 1
+        newline: int = data.rfind(b"\n", start, found.start())
+        line_start: int = start if newline == -1 else newline + 1
+        line_end: int = data.find(b"\n", found.start(), end)
+        line_end = end if line_end == -1 else line_end
+        line_match: re.Match | None = LOG_LINE_PATTERN.match(data, line_start, line_end)
+        if line_match is not None:
+            yield line_match.groups()
+        matched_size += line_end + 1 - line_start
+        position = line_end + 1
+
+def count_levels_in_chunk(log_file_name: str, start: int, end: int, levels_to_print: list[str],
+                          since: str | None = None, until: str | None = None,
+                          stats_options: tuple[int, int] | None = None,
+                          message_filter: MessageFilter | None = None) -> tuple[Counter, bytes, LogStats | None]:
+    """
+    Counts the log levels of the lines in the byte range of the file.
+    Runs in a worker process, so it opens and maps the file by itself.
+
+    :param stats_options: (histogram bucket key length, top templates capacity) when LogStats are collected.
+    :return: counter of the (uppercased) levels, the lines with the levels to print and the stats.
+    The lines are returned as one block of raw bytes, so they are neither decoded nor pickled one by one.
+    """
+    stats: LogStats | None = LogStats(*stats_options) if stats_options else None
+    with open(log_file_name, "rb") as log_file, \
+            mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        return *count_levels_in_buffer(data, start, end, levels_to_print, since, until, stats, message_filter), stats
+
+def count_levels_in_buffer(data, start: int, end: int, levels_to_print: list[str],
+                           since: str | None = None, until: str | None = None,
+                           stats: LogStats | None = None,
+                           message_filter: MessageFilter | None = None) -> tuple[Counter, bytes]:
+    """
+    Counts the log levels of the complete lines in data[start:end] (bytes or a memory map).
+    With since/until only the lines logged in [since, until) are counted.
+    With message_filter only the lines of the supported levels with the matching messages are counted;
+    the level is checked first, so the messages of the other lines are never scanned.
+    With stats the counted lines that have a timestamp are added to the stats too.
+
+    :return: counter of the (uppercased) levels and the newline-terminated lines with the levels to print.
+    """
+    level_counter: Counter = Counter()
+    lines_to_print: list[bytes] = []
+    if stats is not None and not (since or until):
+        # The stats need the timestamps, but the lines without one are still counted below
+        for record in iter_log_records(data, start, end):
+            if message_filter is None or (record.level in SUPPORTED_LOG_LEVELS
+                                          and message_filter.matches(record.message)):
+                stats.add(record)
+    if since or until:
+        for record in iter_log_records(data, start, end):
+            if (since and record.timestamp < since) or (until and record.timestamp >= until):
+                continue
+            if message_filter is not None and (record.level not in SUPPORTED_LOG_LEVELS
+                                               or not message_filter.matches(record.message)):
+                continue
+            if stats is not None:
+                stats.add(record)
+            level_counter[record.level] += 1
+            if record.level in levels_to_print:
+                lines_to_print.append(data[record.offset:record.end].strip())
+    elif levels_to_print or message_filter is not None:
+        # Levels are counted as raw bytes, whether to filter and to print a raw level
+        # is decided once per distinct spelling
+        raw_level_counter: Counter = Counter()
+        raw_level_actions: dict[bytes, tuple[bool, bool]] = {}
+        if message_filter is not None and message_filter.searchable:
+            # Most lines don't match: the regex engine skips them, only the lines with a match are parsed
+            parsed_lines: Iterable[tuple[bytes, bytes, bytes]] = iter_lines_around_matches(
+                data, start, end, message_filter.include[0])
+        else:
+            parsed_lines = LOG_LINE_PATTERN.findall(data, start, end)
+        for line, raw_level, message in parsed_lines:
+            actions: tuple[bool, bool] | None = raw_level_actions.get(raw_level)
+            if actions is None:
+                level: str = raw_level.decode(errors="replace").upper()
+                actions = raw_level_actions[raw_level] = (level in SUPPORTED_LOG_LEVELS, level in levels_to_print)
+            supported, to_print = actions
+            if message_filter is not None and (not supported or not message_filter.matches(message)):
+                continue
+            raw_level_counter[raw_level] += 1
+            if to_print:
+                lines_to_print.append(line.rstrip())
+        for raw_level, count in raw_level_counter.items():
+            level_counter[raw_level.decode(errors="replace").upper()] += count
+    else:
+        # Fast path: the levels are counted as raw bytes, only the distinct ones are decoded
+        for raw_level, count in Counter(LOG_LEVEL_PATTERN.findall(data, start, end)).items():
+            level_counter[raw_level.decode(errors="replace").upper()] += count
+    return level_counter, b"\n".join(lines_to_print) + b"\n" if lines_to_print else b""
+
+def merge_chunk_result(level_counter: dict[str, int], chunk_result: tuple,
+                       stats: LogStats | None = None) -> None:
+    """
+    Adds the counters (and the stats, if both have them) of a chunk to the totals and prints its lines to show.
+    """
+    chunk_counter, lines_to_print, *chunk_stats = chunk_result
+    if stats is not None and chunk_stats and chunk_stats[0] is not None:
+        stats.merge(chunk_stats[0])
+    for level, count in chunk_counter.items():
+        if level in level_counter:
+            level_counter[level] += count
+    if isinstance(lines_to_print, SpilledLines):
+        try:
+            line_writer.write_file(lines_to_print.path)
+        finally:
+            os.remove(lines_to_print.path)
+    elif lines_to_print:
+        line_writer.write(lines_to_print)
+
+class SpilledLines(NamedTuple):
+    """
+    Lines to print that a worker has written to a temporary file instead of returning them.
+    """
+    path: str
+
+def count_levels_in_compressed_file(log_file_name: str, levels_to_print: list[str],
+                                    since: str | None = None, until: str | None = None,
+                                    stats_options: tuple[int, int] | None = None,
+                                    message_filter: MessageFilter | None = None
+                                    ) -> tuple[Counter, bytes | SpilledLines, LogStats | None]:
+    """
+    Counts the log levels of a compressed log, decompressing it block by block.
+    Runs in a worker process: compressed files can't be split into chunks, so one worker reads the whole file.
+    The lines to print are returned as they are up to COMPRESSED_LINES_IN_MEMORY_SIZE bytes;
+    beyond that they go to a temporary file, so a worker never holds all the lines of a big log.
+
+    :return: counter of the levels, the lines to print (or the file with them) and the stats.
+    """
+    stats: LogStats | None = LogStats(*stats_options) if stats_options else None
+    level_counter: Counter = Counter()
+    lines_to_print: list[bytes] = []
+    lines_size: int = 0
+    spill_file = None
+    try:
+        with COMPRESSED_LOG_OPENERS[os.path.splitext(log_file_name)[1].lower()](log_file_name, "rb") as log_file:
+            pending: bytes = b"" # the line cut at the end of the previous block
+            while True:
+                block: bytes = log_file.read(STREAM_BLOCK_SIZE)
+                data: bytes = pending + block
+                # The last block ends the file, its last line is complete even without a newline
+                complete_size: int = data.rfind(b"\n") + 1 if block else len(data)
+                pending = data[complete_size:]
+                block_counter, block_lines = count_levels_in_buffer(data, 0, complete_size, levels_to_print,
+                                                                    since, until, stats, message_filter)
+                level_counter.update(block_counter)
+                if block_lines:
+                    lines_to_print.append(block_lines)
+                    lines_size += len(block_lines)
+                    if lines_size > COMPRESSED_LINES_IN_MEMORY_SIZE:
+                        if spill_file is None:
+                            spill_file = tempfile.NamedTemporaryFile(prefix="log_analyzer.", suffix=".lines",
+                                                                     delete=False)
+                        spill_file.writelines(lines_to_print)
+                        lines_to_print.clear()
+                        lines_size = 0
+                if not block:
+                    break
+        if spill_file is None:
+            return level_counter, b"".join(lines_to_print), stats
+        spill_file.writelines(lines_to_print)
+        spill_file.close()
+        return level_counter, SpilledLines(spill_file.name), stats
+    except BaseException:
+        if spill_file is not None:
+            spill_file.close()
+            os.remove(spill_file.name)
+        raise
+
+def run_tasks(tasks: list[tuple[Callable, tuple]], workers: int) -> Iterator:
+    """
+    Calls function(*args) for every (function, args) task, in a process pool when there is
+    more than one task, and yields the results in the order of the tasks.
+    Only a few tasks per worker are in flight, so the results waiting to be yielded
+    (e.g. the lines to print of the chunks) don't pile up in memory.
+    """
+    if workers > 1 and len(tasks) > 1:
+        max_workers: int = min(workers, len(tasks))
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            pending: deque[Future] = deque()
+            for function, args in tasks:
+                pending.append(executor.submit(function, *args))
+                if len(pending) >= 2 * max_workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+    else:
+        for function, args in tasks:
+            yield function(*args)
+
+def map_chunks(function: Callable, log_file_name: str, chunks: list[tuple[int, int]],
+               workers: int, *args) -> Iterator:
+    """
+    Calls function(log_file_name, start, end, *args) for every chunk, in a process pool
+    when there is more than one chunk, and yields the results in the order of the chunks.
+    """
+    return run_tasks([(function, (log_file_name, start, end, *args)) for start, end in chunks], workers)
+
+def count_levels(log_file_names: list[str], levels_to_print: list[str], workers: int, chunk_size: int,
+                 complete_lines_only: bool = False, since: str | None = None,
+                 until: str | None = None, stats: LogStats | None = None,
+                 message_filter: MessageFilter | None = None) -> tuple[dict[str, int], int]:
+    """
+    Counts the log levels of all files: plain files are split into chunks, compressed ones
+    are decompressed by one worker each, and all of them are fanned out to one process pool.
+    The matching lines are printed chunk by chunk, in the order of the files.
+    When stats are given, the stats of all chunks are merged into them in the same pass.
+
+    :return: the merged level counters and the number of bytes counted in the last plain file.
+    """
+    stats_options: tuple[int, int] | None = None
+    if stats is not None:
+        stats_options = (stats.bucket_key_length, stats.templates.capacity if stats.templates else 0)
+    level_counter: dict[str, int] = {x: 0 for x in SUPPORTED_LOG_LEVELS}
+    tasks: list[tuple[Callable, tuple]] = []
+    position: int = 0
+    for log_file_name in log_file_names:
+        if is_compressed(log_file_name):
+            tasks.append((count_levels_in_compressed_file, (log_file_name, levels_to_print, since, until,
+                                                            stats_options, message_filter)))
+            continue
+        chunks: list[tuple[int, int]] = split_into_chunks(log_file_name, chunk_size, complete_lines_only)
+        tasks += [(count_levels_in_chunk, (log_file_name, start, end, levels_to_print, since, until, stats_options,
+                                           message_filter))
+                  for start, end in chunks]
+        position = chunks[-1][1] if chunks else 0
+
+    for task_result in run_tasks(tasks, workers):
+        merge_chunk_result(level_counter, task_result, stats)
+    line_writer.flush()
+
+    return level_counter, position
+
+def index_chunk(log_file_name: str, start: int, end: int) -> dict[str, list]:
+    """
+    Builds the index buckets of the byte range of the file:
+    bucket key -> [first line offset, end of the last line, {level: count}].
+    Runs in a worker process, so it opens and maps the file by itself.
+    """
+    buckets: dict[str, list] = {}
+    with open(log_file_name, "rb") as log_file, \
+            mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        for record in iter_log_records(data, start, end):
+            bucket = buckets.get(record.timestamp[:INDEX_BUCKET_KEY_LENGTH])
+            if bucket is None:
+                bucket = buckets[record.timestamp[:INDEX_BUCKET_KEY_LENGTH]] = [record.offset, record.end, {}]
+            bucket[1] = record.end
+            bucket[2][record.level] = bucket[2].get(record.level, 0) + 1
+    return buckets
+
+def merge_buckets(buckets: dict[str, list], other_buckets: dict[str, list]) -> None:
+    """
+    Adds the buckets of a later part of the file to the buckets of an earlier one.
+    """
+    for key, (first_offset, end_offset, level_counts) in other_buckets.items():
+        bucket = buckets.get(key)
+        if bucket is None:
+            buckets[key] = [first_offset, end_offset, level_counts]
+            continue
+        bucket[1] = end_offset
+        for level, count in level_counts.items():
+            bucket[2][level] = bucket[2].get(level, 0) + count
+
+def read_log_head(log_file_name: str) -> str:
+    with open(log_file_name, "rb") as log_file:
+        return hashlib.blake2b(log_file.read(INDEX_HEAD_SIZE), digest_size=16).hexdigest()
+
+def update_index(log_file_name: str, workers: int, chunk_size: int) -> dict:
+    """
+    Loads the sidecar index of the log and brings it up to date: when lines were only
+    appended since the last run, just the new part is indexed, otherwise the whole log.
+
+    :return: the index: {"version", "head", "size" (bytes indexed), "buckets"}.
+    """
+    index_file_name: str = log_file_name + INDEX_SUFFIX
+    index: dict | None = None
+    try:
+        with open(index_file_name, "r", encoding="utf-8") as index_file:
+            index = json.load(index_file)
+    except (FileNotFoundError, ValueError):
+        pass
+
+    head: str = read_log_head(log_file_name)
+    log_size: int = os.path.getsize(log_file_name)
+    if (index is None or index.get("version") != INDEX_VERSION or index["head"] != head
+            or index["size"] > log_size):
+        index = {"version": INDEX_VERSION, "head": head, "size": 0, "buckets": {}}
+
+    chunks: list[tuple[int, int]] = split_into_chunks(log_file_name, chunk_size, complete_lines_only=True,
+                                                      first_offset=index["size"])
+    if not chunks:
+        return index # nothing new since the last run
+    for chunk_buckets in map_chunks(index_chunk, log_file_name, chunks, workers):
+        merge_buckets(index["buckets"], chunk_buckets)
+    index["size"] = chunks[-1][1]
+    # The buckets are kept in the order of their keys, so a query bisects to the edges of its range;
+    # the new lines are mostly later ones, so the sort only has a few keys to move
+    index["buckets"] = dict(sorted(index["buckets"].items()))
+
+    # The index is written next to the log and renamed over the old one,
+    # so an interrupted run never leaves a broken index behind
+    temp_file_name: str = f"{index_file_name}.{os.getpid()}.tmp"
+    with open(temp_file_name, "w", encoding="utf-8") as index_file:
+        json.dump(index, index_file, separators=(",", ":"))
+    os.replace(temp_file_name, index_file_name)
+    return index
+
+def count_levels_with_index(log_file_name: str, index: dict, levels_to_print: list[str],
+                            since: str | None, until: str | None,
+                            message_filter: MessageFilter | None = None) -> dict[str, int]:
+    """
+    Answers a time-range query with the index: buckets lying inside the range are summed
+    from the index, only the buckets on its edges and the unindexed end of the log are read from the log.
+    The bucket keys are sorted, so the range is found by bisecting them.
+    When lines have to be printed or filtered, the part of the log holding the range is read instead.
+    """
+    level_counter: dict[str, int] = {x: 0 for x in SUPPORTED_LOG_LEVELS}
+    ranges_to_read: list[tuple[int, int, str | None, str | None]] = []
+    buckets: dict[str, list] = index["buckets"]
+    keys: list[str] = list(buckets)
+    # The bucket "YYYY-MM-DD HH:MM" holds the lines logged in [HH:MM:00, HH:MM:00 + 1 minute)
+    first: int = bisect.bisect_left(keys, since[:INDEX_BUCKET_KEY_LENGTH]) if since else 0
+    last: int = bisect.bisect_left(keys, until, key=lambda key: f"{key}:00") if until else len(keys)
+
+    for position in range(first, last):
+        first_offset, end_offset, level_counts = buckets[keys[position]]
+        if position == first or position == last - 1 or levels_to_print or message_filter is not None:
+            bucket_start: datetime = datetime.strptime(keys[position], INDEX_BUCKET_FORMAT)
+            bucket_since: str = bucket_start.strftime(TIMESTAMP_FORMAT)
+            bucket_until: str = (bucket_start + timedelta(minutes=1)).strftime(TIMESTAMP_FORMAT)
+            if (levels_to_print or message_filter is not None
+                    or (since and bucket_since < since) or (until and bucket_until > until)):
+                # Lines of other buckets may lie in between, so only this bucket's part of the range is counted
+                ranges_to_read.append((first_offset, end_offset, max(since or bucket_since, bucket_since),
+                                       min(until or bucket_until, bucket_until)))
+                continue
+        for level, count in level_counts.items():
+            if level in level_counter:
+                level_counter[level] += count
+
+    if (levels_to_print or message_filter is not None) and ranges_to_read:
+        # One read over the whole range, so the lines are printed in the order of the file
+        start: int = min(first_offset for first_offset, _, _, _ in ranges_to_read)
+        end: int = max(end_offset for _, end_offset, _, _ in ranges_to_read)
+        merge_chunk_result(level_counter, count_levels_in_chunk(log_file_name, start, end, levels_to_print,
+                                                                since, until, None, message_filter))
+    else:
+        for start, end, bucket_since, bucket_until in ranges_to_read:
+            merge_chunk_result(level_counter, count_levels_in_chunk(log_file_name, start, end, levels_to_print,
+                                                                    bucket_since, bucket_until))
+
+    # The index holds complete lines only, so the last line of a log that doesn't end
+    # with a newline is counted from the log on every query
+    log_size: int = os.path.getsize(log_file_name)
+    if index["size"] < log_size:
+        merge_chunk_result(level_counter, count_levels_in_chunk(log_file_name, index["size"], log_size,
+                                                                levels_to_print, since, until, None, message_filter))
+    return level_counter
+
+def follow_log(log_file_name: str, levels_to_print: list[str], level_counter: dict[str, int],
+               position: int, refresh_interval: float, since: str | None = None, until: str | None = None,
+               on_refresh: Callable[[], None] | None = None, message_filter: MessageFilter | None = None) -> None:
+    """
+    Tails the growing log from the position, like tail -F: new complete lines update
+    the counters and the table is refreshed (and on_refresh is called) every refresh_interval seconds until Ctrl+C.
+    A rotated log (the file name points to a new file) is read to its end and
+    the new file is followed from its beginning; a truncated log is followed from its beginning.
+    """
+    log_file = open(log_file_name, "rb")
+    log_file.seek(position)
+    pending: bytes = b"" # the last line read without its newline yet
+    counts_at_refresh: dict[str, int] = dict(level_counter)
+    last_refresh: float = time.monotonic()
+    # Clearing the screen would hide the printed lines
+    clear_screen: bool = sys.stdout.isatty() and not levels_to_print
+
+    def read_new_lines() -> None:
+        nonlocal pending
+        data: bytes = pending + log_file.read()
+        complete_size: int = data.rfind(b"\n") + 1
+        pending = data[complete_size:]
+        if complete_size:
+            merge_chunk_result(level_counter, count_levels_in_buffer(data, 0, complete_size, levels_to_print,
+                                                                            since, until, None, message_filter))
+            line_writer.flush()
+
+    try:
+        while True:
+            read_new_lines()
+            try:
+                file_stat: os.stat_result = os.stat(log_file_name)
+            except FileNotFoundError:
+                file_stat = None # rotated, the new file isn't created yet
+            if file_stat is not None and file_stat.st_ino != os.fstat(log_file.fileno()).st_ino:
+                read_new_lines() # the rest written to the old file before the rotation
+                log_file.close()
+                log_file = open(log_file_name, "rb")
+                pending = b""
+            elif file_stat is not None and file_stat.st_size < log_file.tell():
+                log_file.seek(0) # truncated in place
+                pending = b""
+
+            now: float = time.monotonic()
+            if now - last_refresh >= refresh_interval:
+                rates: dict[str, float] = {
+                    level: (count - counts_at_refresh[level]) / (now - last_refresh)
+                    for level, count in level_counter.items()
+                }
+                if clear_screen:
+                    sys.stdout.write(CLEAR_SCREEN)
+                print(f"{log_file_name} at {time.strftime('%H:%M:%S')}:")
+                pretty_print_counters(level_counter, rates)
+                sys.stdout.flush()
+                if on_refresh is not None:
+                    on_refresh()
+                counts_at_refresh = dict(level_counter)
+                last_refresh = now
+            time.sleep(FOLLOW_POLL_INTERVAL)
+    except KeyboardInterrupt:
+        print("\nStopped following the log (Ctrl+C).")
+    finally:
+        log_file.close()
 
 def log_analyzer() -> None:
-    log_file_name, levels_to_print = parse_cmd_args()
-    levels_to_print: list[str] = validate_log_levels(levels_to_print)
+    args = parse_cmd_args()
+    levels_to_print: list[str] = validate_log_levels(args.levels)
 
     level_counter: dict[str, int] = {x: 0 for x in SUPPORTED_LOG_LEVELS}
+    message_filter: MessageFilter | None = None
+    if args.grep or args.keyword or args.exclude:
+        try:
+            message_filter = MessageFilter(args.grep, args.keyword, args.exclude, args.ignore_case)
+        except re.error as e:
+            print(f"Error: Invalid filter pattern: {e}")
+            return
+
+    # Histograms and top templates are collected in the same pass as the counters
+    stats: LogStats | None = None
+    if args.histogram or args.top > 0:
+        stats = LogStats(HISTOGRAM_BUCKET_KEY_LENGTHS.get(args.histogram, 0), args.top * TOP_TEMPLATES_CAPACITY_FACTOR)
 
-    # Iterate through the lines of the file
+    # Count the levels of the file chunks, in parallel for big files
     try:
-        with open(log_file_name, "r") as log_file:
-            for line in log_file:
-                stripped_line: str = line.strip()
-                _, _, level, *_ = stripped_line.upper().split()
-                if level in level_counter:
-                    level_counter[level] += 1
-                    if level in levels_to_print:
-                        print(stripped_line)
-    except FileNotFoundError:
-        print(f"Error: File not found at path: {log_file_name}")
+        log_file_names: list[str] = expand_log_paths(args.filenames)
+        log_file_name: str = log_file_names[0] if log_file_names else ""
+        if (args.follow or args.index) and (len(log_file_names) != 1 or is_compressed(log_file_name)):
+            print("Error: --follow and --index work with a single uncompressed log file.")
+        elif (args.follow or args.index) and stats is not None:
+            print("Error: --histogram and --top can't be combined with --follow or --index.")
+        elif args.index and not args.follow:
+            index: dict = update_index(log_file_name, args.workers, args.chunk_size * 1024 * 1024)
+            level_counter = count_levels_with_index(log_file_name, index, levels_to_print, args.since, args.until,
+                                                    message_filter)
+        else:
+            level_counter, position = count_levels(log_file_names, levels_to_print, args.workers,
+                                                   args.chunk_size * 1024 * 1024, complete_lines_only=args.follow,
+                                                   since=args.since, until=args.until, stats=stats,
+                                                   message_filter=message_filter)
+            if len(log_file_names) > 1 and args.format == "text":
+                print(f"\nAnalyzed {len(log_file_names)} log files.")
+            if args.follow:
+                # Only a report written to a file is refreshed, the live table is on the standard output
+                report_to_file: Callable[[], None] | None = None
+                if args.output is not None:
+                    report_to_file = lambda: write_report(args.format, args.output, level_counter)
+                follow_log(log_file_name, levels_to_print, level_counter, position, args.interval,
+                           args.since, args.until, report_to_file, message_filter)
+    except FileNotFoundError as e:
+        print(f"Error: File not found at path: {e.filename}")
     except Exception as e:
         print(f"An unexpected error occurred while reading the file: {e}")
+    line_writer.flush()
 
-    # Output the counters in a table format
-    pretty_print_counters(level_counter)
+    # Output the counters in the requested format
+    try:
+        write_report(args.format, args.output, level_counter, stats, args.top)
+    except OSError as e:
+        print(f"Error: Can't write the report to {args.output}: {e}")
 
 
 if __name__ == '__main__':
@@ -1,13 +1,62 @@
 from __future__ import annotations
-import pickle, sys
-from collections import UserDict
-from datetime import datetime, timedelta
-from typing import Callable, Final
+import argparse, asyncio, bisect, csv, functools, gc, hashlib, heapq, importlib, itertools, json, mmap, os, pickle, re, signal, stat, struct, sys, threading, time
+from array import array
+from contextlib import contextmanager, nullcontext
+from collections import Counter, UserDict, deque
+from collections.abc import MutableMapping
+from datetime import date, datetime, timedelta
+from typing import Callable, Final, Iterable, Iterator
+
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+    try:
+        import msvcrt
+    except ImportError:
+        msvcrt = None
 
 
 NUMBER_OF_UPCOMING_DAYS: Final[int] = 20
+MAX_UPCOMING_DAYS: Final[int] = 365
+SEARCH_RESULTS_LIMIT: Final[int] = 20
+DEFAULT_PAGE_SIZE: Final[int] = 20
+# Minimal share of common trigrams for a name to be a fuzzy search match
+FUZZY_SEARCH_THRESHOLD: Final[float] = 0.3
+# Bigger batches are merged into the sorted name index with one sort instead of insertions
+NAME_INDEX_BULK_THRESHOLD: Final[int] = 1000
 DATE_FORMAT: Final[str] = '%d.%m.%Y'
-ADDRESS_BOOK_FILE_NAME: Final[str] = 'data_files/addressbook.pkl'
+PHONE_LENGTH: Final[int] = 10
+# Country code cut off from the international form of the phones kept in the book
+PHONE_COUNTRY_CODE: Final[str] = '38'
+# Separators people put into phone numbers, removed before the validation
+PHONE_SEPARATORS: Final[dict[int, None]] = str.maketrans('', '', ' \t()-.')
+# Everything but letters and digits, ignored when contact names are compared by dedupe
+NAME_KEY_IGNORED: Final[re.Pattern] = re.compile(r'[\W_]+')
+ADDRESS_BOOK_FILE_NAME: Final[str] = 'data_files/addressbook.bin'
+# Books saved by the earlier versions of the bot, migrated on the first save
+LEGACY_ADDRESS_BOOK_FILE_NAME: Final[str] = 'data_files/addressbook.pkl'
+JOURNAL_FILE_NAME: Final[str] = 'data_files/addressbook.journal'
+# Number of journal entries after which the journal is folded into a new snapshot
+JOURNAL_COMPACTION_THRESHOLD: Final[int] = 1000
+LAZY_BOOK_FILE_NAME: Final[str] = 'data_files/addressbook.dat'
+# Rows read, validated and added to the book at once by the import command
+IMPORT_CHUNK_SIZE: Final[int] = 10_000
+# How many rejected rows are shown after an import, the rest go to the '.rejected' file
+IMPORT_REJECTED_PREVIEW: Final[int] = 10
+CSV_HEADER: Final[list[str]] = ['name', 'phones', 'birthday']
+CSV_PHONES_SEPARATOR: Final[str] = ';'
+# Output lines collected by the batch mode before they are written out
+BATCH_OUTPUT_BUFFER_SIZE: Final[int] = 1000
+DEFAULT_SERVER_PORT: Final[int] = 8765
+# The book is saved in the background every AUTOSAVE_INTERVAL seconds,
+# or earlier once AUTOSAVE_MAX_CHANGES changes were made since the last save
+AUTOSAVE_INTERVAL: Final[float] = 60.0
+AUTOSAVE_MAX_CHANGES: Final[int] = 100
+# Number of commands that can be undone
+UNDO_HISTORY_LIMIT: Final[int] = 100
+# Commands changing more contacts than this (e.g. big imports) reset the undo history
+UNDO_MAX_STEP_CHANGES: Final[int] = 10_000
 
 class PhoneFormatError(Exception):
     def __init__(self, message):
@@ -16,9 +65,20 @@ class PhoneFormatError(Exception):
 
 
 class Field:
+    # Fields are created for every contact, so they keep their value in a slot
+    # instead of a per-instance __dict__
+    __slots__ = ('value',)
+
     def __init__(self, value):
         self.value = value
 
+    def __setstate__(self, state) -> None:
+        # Books pickled before the fields got __slots__ store a plain __dict__ state
+        if isinstance(state, tuple):
+            state = state[1]
+        for attr_name, attr_value in state.items():
+            setattr(self, attr_name, attr_value)
+
     def __eq__(self, other: Field) -> bool:
         return self.value == other.value
 
@@ -30,93 +90,563 @@ class Field:
 
 
 class Name(Field):
+    __slots__ = ()
+
     def __init__(self, value: str):
-        super().__init__(value)
+        super().__init__(sys.intern(value))
+
 
+def normalize_phone(phone: str) -> str:
+    # '+38(050)123-32-34', '38050 123 32 34' and '050.123.32.34' all become '0501233234'.
+    # A plus is only allowed in front of the country code: other international
+    # numbers keep it and fail the validation
+    digits = phone.translate(PHONE_SEPARATORS)
+    if digits.startswith('+' + PHONE_COUNTRY_CODE):
+        digits = digits[1:]
+    if len(digits) == len(PHONE_COUNTRY_CODE) + PHONE_LENGTH and digits.startswith(PHONE_COUNTRY_CODE):
+        digits = digits[len(PHONE_COUNTRY_CODE):]
+    return digits
 
 class Phone(Field):
+    __slots__ = ()
+
     def __init__(self, value: str):
+        value = normalize_phone(value)
         self.__validate_phone(value)
         super().__init__(value)
 
     def __validate_phone(self, phone):
+        if phone.startswith('+'):
+            raise PhoneFormatError(f"❌ Only the numbers with the +{PHONE_COUNTRY_CODE} country code are supported!")
         if not phone.isdigit():
             raise PhoneFormatError("❌ Phone number should contain digits only!")
-        if len(phone) != 10:
-            raise PhoneFormatError("❌ Phone number should contain exactly 10 digits!")
+        if len(phone) != PHONE_LENGTH:
+            raise PhoneFormatError(f"❌ Phone number should contain exactly {PHONE_LENGTH} digits!")
+
+    @property
+    def number(self) -> int:
+        # Packed form of the phone, as stored by Record
+        return int(self.value)
+
+    @classmethod
+    def from_number(cls, number: int) -> Phone:
+        phone = cls.__new__(cls)
+        phone.value = f"{number:0{PHONE_LENGTH}d}"
+        return phone
 
 class Birthday(Field):
+    __slots__ = ()
+
     def __init__(self, date: str):
         try:
             super().__init__(datetime.strptime(date, DATE_FORMAT).date())
         except ValueError:
             raise ValueError("❌ Invalid date format! Use DD.MM.YYYY")
 
+    @classmethod
+    def from_ordinal(cls, ordinal: int) -> Birthday:
+        birthday = cls.__new__(cls)
+        birthday.value = date.fromordinal(ordinal)
+        return birthday
+
     def __str__(self):
         return self.value.strftime(DATE_FORMAT)
 
 class Record:
+    # Phones are kept as packed integers in an array and the birthday as a date
+    # ordinal; Phone and Birthday objects are only created when they are read
+    __slots__ = ('name', '_phones', '_birthday', '_book')
+
     def __init__(self, name: str):
         self.name = Name(name)
-        self.phones = []
-        self.birthday = None
+        self._phones = array('Q')
+        self._birthday = 0 # date ordinal, 0 when the birthday is not set
+        self._book = None # address book that gets notified about changes
+
+    def __getstate__(self) -> tuple:
+        return self.name.value, self._phones, self._birthday
+
+    def __setstate__(self, state) -> None:
+        self._book = None
+        if isinstance(state, dict): # record pickled before the compact layout
+            self.name = state['name']
+            self._phones = array('Q', (phone.number for phone in state['phones']))
+            self._birthday = state['birthday'].value.toordinal() if state['birthday'] else 0
+        else:
+            name, self._phones, self._birthday = state
+            self.name = Name(name)
+
+    @classmethod
+    def from_packed(cls, name: str, phones: array, birthday: int) -> Record:
+        # Fast path for the storage code: builds a record from already validated packed values
+        record = cls.__new__(cls)
+        record.name = Name.__new__(Name)
+        record.name.value = sys.intern(name)
+        record._phones = phones
+        record._birthday = birthday
+        record._book = None
+        return record
+
+    @property
+    def phones(self) -> tuple[Phone, ...]:
+        return tuple(Phone.from_number(number) for number in self._phones)
+
+    @property
+    def birthday(self) -> Birthday | None:
+        return Birthday.from_ordinal(self._birthday) if self._birthday else None
+
+    def _notify(self, operation: str, *args) -> None:
+        if self._book is not None:
+            self._book.notify(operation, self.name.value, *args)
 
     def add_phone(self, phone: str) -> None:
-        self.phones.append(Phone(phone))
+        phone = Phone(phone)
+        self._phones.append(phone.number)
+        self._notify("add_phone", phone.value)
 
     def add_birthday(self, date: str) -> None:
-        self.birthday = Birthday(date)
+        previous_birthday = str(self.birthday) if self._birthday else None
+        self._birthday = Birthday(date).value.toordinal()
+        self._notify("add_birthday", date, previous_birthday)
+
+    def remove_birthday(self) -> None:
+        if self._birthday:
+            previous_birthday = str(self.birthday)
+            self._birthday = 0
+            self._notify("remove_birthday", previous_birthday)
 
     def find_phone(self, phone_str: str) -> Phone | None:
-        for phone in self.phones:
-            if phone.value == phone_str:
-                return phone
+        phone_str = normalize_phone(phone_str)
+        if len(phone_str) == PHONE_LENGTH and phone_str.isdigit() and int(phone_str) in self._phones:
+            return Phone.from_number(int(phone_str))
         return None
 
     def edit_phone(self, old_phone_str: str, new_phone_str: str) -> None:
-        for i, phone in enumerate(self.phones):
-            if phone.value == old_phone_str:
-                self.phones[i] = Phone(new_phone_str)
+        new_phone = Phone(new_phone_str)
+        new_number = new_phone.number
+        edited = False
+        old_phone = self.find_phone(old_phone_str)
+        if old_phone is not None:
+            old_number = old_phone.number
+            if new_number != old_number and new_number in self._phones:
+                # The edit couldn't be undone exactly: its inverse would rewrite both copies
+                raise KeyError(f"❌ Contact '{self.name.value}' already has the phone '{new_phone.value}'!")
+            for i, number in enumerate(self._phones):
+                if number == old_number:
+                    self._phones[i] = new_number
+                    edited = True
+        if edited:
+            self._notify("edit_phone", old_phone.value, new_phone.value)
 
     def remove_phone(self, phone_str: str) -> None:
-        self.phones.remove(Phone(phone_str))
+        phone = Phone(phone_str)
+        self._phones.remove(phone.number)
+        self._notify("remove_phone", phone.value)
 
     def __str__(self):
         result_str = f"Contact name: {self.name.value}, phone(s): {', '.join(p.value for p in self.phones)}"
-        if self.birthday:
+        if self._birthday:
             result_str += f", birthday: {self.birthday}"
         return result_str
 
 
+def record_to_dict(record: Record) -> dict:
+    return {
+        "name": record.name.value,
+        "phones": [f"{number:0{PHONE_LENGTH}d}" for number in record._phones],
+        "birthday": str(record.birthday) if record._birthday else None,
+    }
+
+def record_from_dict(data: dict) -> Record:
+    record = Record(data["name"])
+    for phone in data.get("phones") or []:
+        record.add_phone(phone)
+    if data.get("birthday"):
+        record.add_birthday(data["birthday"])
+    return record
+
+
+# Binary record layout shared by the on-disk formats:
+# name length, birthday ordinal (0 when not set), number of phones,
+# then the UTF-8 name and every phone as a packed little-endian unsigned 64-bit integer
+RECORD_HEADER: Final[struct.Struct] = struct.Struct('<HIH')
+PHONE_SIZE: Final[int] = 8
+NATIVE_LITTLE_ENDIAN: Final[bool] = sys.byteorder == 'little'
+
+def encode_record(record: Record) -> bytes:
+    name = record.name.value.encode("utf-8")
+    phones = record._phones
+    if not NATIVE_LITTLE_ENDIAN:
+        phones = array('Q', phones)
+        phones.byteswap()
+    return RECORD_HEADER.pack(len(name), record._birthday, len(phones)) + name + phones.tobytes()
+
+def decode_record_name(buffer, offset: int = 0) -> str:
+    name_length, _, _ = RECORD_HEADER.unpack_from(buffer, offset)
+    start = offset + RECORD_HEADER.size
+    return bytes(buffer[start:start + name_length]).decode("utf-8")
+
+def record_size(buffer, offset: int = 0) -> int:
+    name_length, _, phones_count = RECORD_HEADER.unpack_from(buffer, offset)
+    return RECORD_HEADER.size + name_length + phones_count * PHONE_SIZE
+
+def decode_record(buffer, offset: int = 0) -> tuple[Record, int]:
+    # Returns the record and the offset right after it
+    name_length, birthday, phones_count = RECORD_HEADER.unpack_from(buffer, offset)
+    offset += RECORD_HEADER.size
+    name = str(buffer[offset:offset + name_length], "utf-8")
+    offset += name_length
+    phones = array('Q', buffer[offset:offset + phones_count * PHONE_SIZE])
+    if not NATIVE_LITTLE_ENDIAN:
+        phones.byteswap()
+    offset += phones_count * PHONE_SIZE
+    return Record.from_packed(name, phones, birthday), offset
+
+
+def name_trigrams(name: str) -> set[str]:
+    # Padding makes the first letters count more, as typos there are rare
+    padded = f"  {name.casefold()} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def is_one_typo_away(first: str, second: str) -> bool:
+    # One letter added, missing or replaced, or two neighbouring letters swapped
+    if abs(len(first) - len(second)) > 1:
+        return False
+    if len(first) > len(second):
+        first, second = second, first
+    position = 0
+    while position < len(first) and first[position] == second[position]:
+        position += 1
+    if len(first) < len(second):
+        return first[position:] == second[position + 1:]
+    if first[position + 1:] == second[position + 1:]:
+        return True # replaced (or no typo at all)
+    swapped = first[position + 1:position + 2] + first[position:position + 1]
+    return second[position:position + 2] == swapped and first[position + 2:] == second[position + 2:]
+
+def is_leap_year(year: int) -> bool:
+    return year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
+
+
 class AddressBook(UserDict):
+    def __init__(self, *args, **kwargs):
+        self.listeners = [] # callables notified as listener(operation, name, *args)
+        self.journal_seq = 0 # sequence number of the last journal entry included in this book
+        self.generation = 0 # number of saves of the book file this book was loaded from
+        self.changes = 0 # changes made since the book was loaded or saved
+        self.replaying = False # changes of other processes are being applied, see replaying_changes()
+        self.lock = threading.RLock() # held by commands and background saves
+        self.history = None # History of the changes, when undo is enabled
+        self.command_context = nullcontext # entered around every command, set by the storage
+        self.phone_index = None # phone -> names of its owners, built on the first lookup
+        self.birthday_index = None # (month, day) -> names of contacts born that day, built on the first lookup
+        self.sorted_names = None # sorted (casefolded name, name) pairs for prefix search, built on the first search
+        self.trigram_index = None # name trigram -> names containing it for fuzzy search, built on the first search
+        super().__init__(*args, **kwargs)
+
+    def __getstate__(self) -> dict:
+        return {"data": self.data, "journal_seq": self.journal_seq}
+
+    def __setstate__(self, state: dict) -> None:
+        self.listeners = []
+        self.journal_seq = state.get("journal_seq", 0)
+        self.generation = 0
+        self.changes = 0
+        self.replaying = False
+        self.lock = threading.RLock()
+        self.history = None
+        self.command_context = nullcontext
+        self.phone_index = None
+        self.birthday_index = None
+        self.sorted_names = None
+        self.trigram_index = None
+        self.data = state["data"]
+        for record in self.data.values():
+            record._book = self
+
+    def replace_contents(self, other: AddressBook) -> None:
+        # Takes over the records of a freshly loaded copy of the book, keeping the listeners
+        self.data = other.data
+        self.journal_seq = other.journal_seq
+        self.generation = other.generation
+        for record in self.data.values():
+            record._book = self
+        self.phone_index = None
+        self.birthday_index = None
+        self.sorted_names = None
+        self.trigram_index = None
+
+    def subscribe(self, listener: Callable) -> None:
+        self.listeners.append(listener)
+
+    @contextmanager
+    def replaying_changes(self):
+        # Changes applied inside are already stored (e.g. journaled by another process):
+        # they update the indexes, but the listeners don't record, journal or count them
+        previous, self.replaying = self.replaying, True
+        try:
+            yield
+        finally:
+            self.replaying = previous
+
+    def is_dirty(self) -> bool:
+        return self.changes > 0
+
+    def mark_clean(self) -> None:
+        self.changes = 0
+
+    def notify(self, operation: str, name: str, *args) -> None:
+        if self.replaying:
+            self._update_indexes(operation, name, *args)
+            return
+        if operation != "add_records": # the batch is counted by add_records() itself
+            self.changes += 1
+        self._update_indexes(operation, name, *args)
+        for listener in self.listeners:
+            listener(operation, name, *args)
+
+    def _index_birthday(self, birthday: date, name: str) -> None:
+        self.birthday_index.setdefault((birthday.month, birthday.day), set()).add(name)
+
+    def _unindex_birthday(self, birthday: date, name: str) -> None:
+        key = (birthday.month, birthday.day)
+        names = self.birthday_index.get(key)
+        if names is not None:
+            names.discard(name)
+            if not names:
+                del self.birthday_index[key]
+
+    def _index_name(self, name: str, keep_sorted: bool = True) -> None:
+        if keep_sorted:
+            bisect.insort(self.sorted_names, (name.casefold(), name))
+        else:
+            self.sorted_names.append((name.casefold(), name))
+        for trigram in name_trigrams(name):
+            self.trigram_index.setdefault(trigram, set()).add(name)
+
+    def _unindex_name(self, name: str) -> None:
+        key = (name.casefold(), name)
+        position = bisect.bisect_left(self.sorted_names, key)
+        if position < len(self.sorted_names) and self.sorted_names[position] == key:
+            del self.sorted_names[position]
+        for trigram in name_trigrams(name):
+            names = self.trigram_index.get(trigram)
+            if names is not None:
+                names.discard(name)
+                if not names:
+                    del self.trigram_index[trigram]
+
+    def _indexes_built(self) -> bool:
+        return (self.phone_index is not None or self.birthday_index is not None
+                or self.sorted_names is not None)
+
+    def _index_record(self, record: Record, keep_sorted: bool = True) -> None:
+        if self.phone_index is not None:
+            for phone in record.phones:
+                self.phone_index.setdefault(phone.value, set()).add(record.name.value)
+        if self.birthday_index is not None and record.birthday:
+            self._index_birthday(record.birthday.value, record.name.value)
+        if self.sorted_names is not None:
+            self._index_name(record.name.value, keep_sorted)
+
+    def _unindex_phone(self, phone: str, name: str) -> None:
+        owners = self.phone_index.get(phone)
+        if owners is not None:
+            owners.discard(name)
+            if not owners:
+                del self.phone_index[phone]
+
+    def _unindex_record(self, record: Record) -> None:
+        if self.phone_index is not None:
+            for phone in record.phones:
+                self._unindex_phone(phone.value, record.name.value)
+        if self.birthday_index is not None and record.birthday:
+            self._unindex_birthday(record.birthday.value, record.name.value)
+        if self.sorted_names is not None:
+            self._unindex_name(record.name.value)
+
+    def _update_indexes(self, operation: str, name: str, *args) -> None:
+        # Whole-record changes are indexed by add_record() and delete() themselves
+        if operation == "add_birthday":
+            if self.birthday_index is not None:
+                if len(args) > 1 and args[1]:
+                    self._unindex_birthday(Birthday(args[1]).value, name)
+                self._index_birthday(self.data[name].birthday.value, name)
+            return
+        if operation == "remove_birthday":
+            if self.birthday_index is not None:
+                self._unindex_birthday(Birthday(args[0]).value, name)
+            return
+        if self.phone_index is None or operation in ("add_record", "add_records", "delete"):
+            return
+        if operation == "add_phone":
+            self.phone_index.setdefault(args[0], set()).add(name)
+        elif operation in ("edit_phone", "remove_phone"):
+            old_phone = args[0]
+            if self.data[name].find_phone(old_phone) is None:
+                self._unindex_phone(old_phone, name)
+            if operation == "edit_phone":
+                self.phone_index.setdefault(args[1], set()).add(name)
+
+    def add_records(self, records: list[Record]) -> None:
+        # Bulk version of add_record() that announces the whole batch as one change,
+        # together with the replaced records
+        keep_sorted = len(records) < NAME_INDEX_BULK_THRESHOLD
+        replaced = {}
+        if self.listeners:
+            for record in records:
+                previous_record = self.data.get(record.name.value)
+                if previous_record is not None and record.name.value not in replaced:
+                    replaced[record.name.value] = record_to_dict(previous_record)
+        for record in records:
+            if self._indexes_built() and record.name.value in self.data:
+                self._unindex_record(self.data[record.name.value])
+            self.data[record.name.value] = record
+            record._book = self
+            self._index_record(record, keep_sorted)
+        if self.sorted_names is not None and not keep_sorted:
+            self.sorted_names.sort()
+        if self.replaying:
+            return
+        self.changes += len(records)
+        if self.listeners: # don't encode the batch when nobody is listening
+            self.notify("add_records", "", [record_to_dict(record) for record in records], replaced)
+
     def add_record(self, record: Record):
+        # The replaced record is announced along with the new one, so the change can be undone
+        previous_record = self.data.get(record.name.value)
+        if self._indexes_built() and previous_record is not None:
+            self._unindex_record(previous_record)
         self.data[record.name.value] = record
+        record._book = self
+        self._index_record(record)
+        if self.listeners:
+            previous = record_to_dict(previous_record) if previous_record is not None else None
+            self.notify("add_record", record.name.value, record_to_dict(record), previous)
+        else:
+            self.notify("add_record", record.name.value)
 
     def find(self, name: str) -> Record:
         return self.get(name)
 
+    def iter_records(self) -> Iterator[Record]:
+        # Read-only walk over all records in the order they were added
+        return iter(self.data.values())
+
+    def find_by_phone(self, phone: str) -> list[Record]:
+        if self.phone_index is None:
+            # Only this index is built here, the others are kept up to date already
+            self.phone_index = {}
+            for record in self.iter_records(): # a lazy book isn't pulled into memory
+                for record_phone in record.phones:
+                    self.phone_index.setdefault(record_phone.value, set()).add(record.name.value)
+        return [self.data[name] for name in sorted(self.phone_index.get(phone, ()))]
+
+    def search(self, query: str, limit: int = SEARCH_RESULTS_LIMIT) -> list[Record]:
+        # Names starting with the query come first (case-insensitive), then the
+        # names sharing the most trigrams with it, which tolerates typos
+        if self.sorted_names is None:
+            self.sorted_names, self.trigram_index = [], {}
+            for name in self.data:
+                self._index_name(name, keep_sorted=False)
+            self.sorted_names.sort()
+
+        prefix = query.casefold()
+        found_names = []
+        position = bisect.bisect_left(self.sorted_names, (prefix, ""))
+        while (len(found_names) < limit and position < len(self.sorted_names)
+               and self.sorted_names[position][0].startswith(prefix)):
+            found_names.append(self.sorted_names[position][1])
+            position += 1
+
+        if len(found_names) < limit:
+            query_trigrams = name_trigrams(query)
+            common_trigrams = Counter()
+            for trigram in query_trigrams:
+                common_trigrams.update(self.trigram_index.get(trigram, ()))
+            scored_names = []
+            # The similarity can't reach the threshold with fewer common trigrams than this
+            min_common = FUZZY_SEARCH_THRESHOLD * len(query_trigrams)
+            for name, common in common_trigrams.items():
+                if common >= min_common:
+                    # Jaccard similarity of the trigram sets
+                    score = common / (len(query_trigrams) + len(name_trigrams(name)) - common)
+                    if score >= FUZZY_SEARCH_THRESHOLD:
+                        scored_names.append((-score, name))
+                        continue
+                # In a short name one typo breaks most of the trigrams, e.g. 'Jhon' shares
+                # only one of them with 'John', so such names are matched letter by letter
+                if is_one_typo_away(prefix, name.casefold()):
+                    scored_names.append((-FUZZY_SEARCH_THRESHOLD, name))
+            prefix_matches = set(found_names)
+            for _, name in heapq.nsmallest(limit, scored_names):
+                if len(found_names) >= limit:
+                    break
+                if name not in prefix_matches:
+                    found_names.append(name)
+        return [self.data[name] for name in found_names]
+
     def delete(self, name):
+        record = self.data[name]
+        if self._indexes_built():
+            self._unindex_record(record)
         del self.data[name]
+        if self.listeners:
+            self.notify("delete", name, record_to_dict(record))
+        else:
+            self.notify("delete", name)
+
+    def apply(self, operation: str, name: str, *args) -> None:
+        # Re-applies a change in the same form it was announced to the listeners
+        if operation == "add_record":
+            self.add_record(record_from_dict(args[0]))
+        elif operation == "add_records":
+            self.add_records([record_from_dict(data) for data in args[0]])
+        elif operation == "delete":
+            self.delete(name)
+        elif operation == "add_phone":
+            self.data[name].add_phone(*args)
+        elif operation == "edit_phone":
+            self.data[name].edit_phone(*args)
+        elif operation == "remove_phone":
+            self.data[name].remove_phone(*args)
+        elif operation == "add_birthday":
+            self.data[name].add_birthday(args[0])
+        elif operation == "remove_birthday":
+            self.data[name].remove_birthday()
+        else:
+            raise ValueError(f"Unknown address book operation: '{operation}'")
+
+    def get_upcoming_birthdays(self, days: int = NUMBER_OF_UPCOMING_DAYS) -> list[tuple]:
+        if self.birthday_index is None:
+            self.birthday_index = {}
+            for record in self.iter_records(): # a lazy book isn't pulled into memory
+                if record.birthday:
+                    self._index_birthday(record.birthday.value, record.name.value)
 
-    def get_upcoming_birthdays(self) -> list[tuple]:
         today_date = datetime.today().date()
-        end_date = today_date + timedelta(days=NUMBER_OF_UPCOMING_DAYS)
         contacts_with_upcoming_birthdays = []
 
-        for contact in self.data.values():
-            if not contact.birthday:
+        # Only the calendar days inside the window are visited, in order,
+        # so the result is already sorted by the congratulation date
+        visited_days = set()
+        for day_offset in range(min(days, MAX_UPCOMING_DAYS) + 1):
+            birthday_date = today_date + timedelta(days=day_offset)
+            if (birthday_date.month, birthday_date.day) in visited_days:
+                break # the window spans a whole year, a birthday is listed once
+            visited_days.add((birthday_date.month, birthday_date.day))
+            names = set(self.birthday_index.get((birthday_date.month, birthday_date.day), ()))
+            if birthday_date.month == 3 and birthday_date.day == 1 and not is_leap_year(birthday_date.year):
+                # people born on February 29 are congratulated on March 1 in non-leap years
+                names.update(self.birthday_index.get((2, 29), ()))
+            if not names:
                 continue
-            physical_bd = contact.birthday.value
-            this_or_next_year_bd = physical_bd.replace(year=today_date.year)
-            if this_or_next_year_bd < today_date:
-                this_or_next_year_bd = this_or_next_year_bd.replace(year=today_date.year + 1)
-            if today_date <= this_or_next_year_bd <= end_date:
-                congratulation_date = this_or_next_year_bd
-                if this_or_next_year_bd.weekday() in (5, 6):
-                    days_to_next_monday = 7 - this_or_next_year_bd.weekday()
-                    congratulation_date = (this_or_next_year_bd + timedelta(days=days_to_next_monday))
-                contacts_with_upcoming_birthdays.append((contact, congratulation_date))
-            contacts_with_upcoming_birthdays.sort(key=lambda x: x[1])
+            congratulation_date = birthday_date
+            if birthday_date.weekday() in (5, 6):
+                days_to_next_monday = 7 - birthday_date.weekday()
+                congratulation_date = birthday_date + timedelta(days=days_to_next_monday)
+            for name in sorted(names):
+                contacts_with_upcoming_birthdays.append((self.data[name], congratulation_date))
         return contacts_with_upcoming_birthdays
 
 def input_error(func: Callable) -> Callable:
@@ -136,6 +666,226 @@ def parse_input(user_input: str) -> tuple[str, list[str]]:
     cmd = cmd.strip().lower()
     return cmd, *args
 
+class HistorySession:
+    # Changes of the running command or of the open transaction of one client
+    def __init__(self):
+        self.step = None
+        self.step_size = 0
+        self.in_transaction = False
+
+class History:
+    # Undo/redo history built from the change notifications of the book. Every
+    # change carries what it replaced, so a step is undone by applying the inverse
+    # changes instead of restoring a copy of the book. A step is all changes of
+    # one command, or of all commands between 'begin' and 'commit'.
+    # In the server mode the undo steps are shared by all clients, but every
+    # client has its own HistorySession, so a transaction only groups its own commands.
+    def __init__(self, address_book: AddressBook, limit: int = UNDO_HISTORY_LIMIT,
+                 max_step_changes: int = UNDO_MAX_STEP_CHANGES):
+        self.address_book = address_book
+        self.undo_steps = deque(maxlen=limit)
+        self.redo_steps = []
+        self.max_step_changes = max_step_changes
+        self.session = HistorySession() # the one of the client whose command is running
+        self.replaying = False
+        address_book.history = self
+        address_book.subscribe(self._on_change)
+
+    @property
+    def in_transaction(self) -> bool:
+        return self.session.in_transaction
+
+    @contextmanager
+    def using(self, session: HistorySession):
+        # Runs a command of another client with its own running step and transaction
+        previous, self.session = self.session, session
+        try:
+            yield
+        finally:
+            self.session = previous
+
+    def _on_change(self, operation: str, name: str, *args) -> None:
+        if self.replaying:
+            return
+        self.redo_steps.clear()
+        if self.session.step is None: # change made outside of a command
+            self._begin_step()
+            self._record(operation, name, *args)
+            self._end_step()
+        else:
+            self._record(operation, name, *args)
+
+    def _record(self, operation: str, name: str, *args) -> None:
+        if self.session.step_size > self.max_step_changes:
+            return # too big to keep, the step is dropped when it ends
+        self.session.step_size += len(args[0]) if operation == "add_records" else 1
+        if self.session.step_size > self.max_step_changes:
+            self.session.step.clear()
+        else:
+            self.session.step.append((operation, name, *args))
+
+    def _begin_step(self) -> None:
+        self.session.step = []
+        self.session.step_size = 0
+
+    def _end_step(self) -> None:
+        if self.session.step_size > self.max_step_changes:
+            # The earlier steps can't be undone past a change that wasn't kept
+            self.undo_steps.clear()
+        elif self.session.step:
+            self.undo_steps.append(self.session.step)
+        self.session.step = None
+
+    @contextmanager
+    def command(self):
+        # Groups the changes made by one command into one undo step
+        if self.session.in_transaction:
+            yield
+            return
+        self._begin_step()
+        try:
+            yield
+        finally:
+            self._end_step()
+
+    @staticmethod
+    def inverse(operation: str, name: str, *args) -> list[tuple]:
+        if operation == "add_record":
+            return [("add_record", name, args[1], args[0]) if args[1] else ("delete", name)]
+        if operation == "add_records":
+            records, replaced = args
+            inverse_changes, names = [], set()
+            for data in reversed(records):
+                if data["name"] in names:
+                    continue # added more than once, the first addition is undone below
+                names.add(data["name"])
+                if data["name"] in replaced:
+                    inverse_changes.append(("add_record", data["name"], replaced[data["name"]], data))
+                else:
+                    inverse_changes.append(("delete", data["name"]))
+            return inverse_changes
+        if operation == "delete":
+            return [("add_record", name, args[0], None)]
+        if operation == "add_phone":
+            return [("remove_phone", name, args[0])]
+        if operation == "edit_phone":
+            return [("edit_phone", name, args[1], args[0])]
+        if operation == "remove_phone":
+            return [("add_phone", name, args[0])]
+        if operation == "add_birthday":
+            return [("add_birthday", name, args[1], args[0]) if args[1] else ("remove_birthday", name, args[0])]
+        if operation == "remove_birthday":
+            return [("add_birthday", name, args[0], None)]
+        raise ValueError(f"Unknown address book operation: '{operation}'")
+
+    def _replay(self, changes: Iterable[tuple]) -> None:
+        # The replayed changes reach the other listeners (journal, autosave) as usual
+        self.replaying = True
+        try:
+            for change in changes:
+                self.address_book.apply(*change)
+        finally:
+            self.replaying = False
+
+    def _undo_step(self, step: list[tuple]) -> None:
+        self._replay(inverse_change for change in reversed(step) for inverse_change in self.inverse(*change))
+
+    def undo(self) -> bool:
+        if not self.undo_steps:
+            return False
+        step = self.undo_steps.pop()
+        self._undo_step(step)
+        self.redo_steps.append(step)
+        return True
+
+    def redo(self) -> bool:
+        if not self.redo_steps:
+            return False
+        step = self.redo_steps.pop()
+        self._replay(step)
+        self.undo_steps.append(step)
+        return True
+
+    def begin(self) -> None:
+        self.session.in_transaction = True
+        self._begin_step()
+
+    def commit(self) -> int:
+        # Returns the number of changes made in the transaction
+        changes = self.session.step_size
+        self.session.in_transaction = False
+        self._end_step()
+        return changes
+
+    def rollback(self) -> int | None:
+        # Returns the number of undone changes, None when the transaction was too big to keep
+        changes = self.session.step_size
+        step, self.session.step = self.session.step, None
+        self.session.in_transaction = False
+        if changes > self.max_step_changes:
+            self.undo_steps.clear()
+            return None
+        self._undo_step(step)
+        return changes
+
+class Command:
+    # Registered bot command: checks the number of arguments before calling
+    # the handler and accumulates the handler's calls count and run time
+    def __init__(self, name: str, handler: Callable, min_args: int = 0, max_args: int | None = None, usage: str = ""):
+        self.name = name
+        self.handler = handler
+        self.min_args = min_args
+        self.max_args = max_args
+        self.usage = usage or name
+        self.calls = 0
+        self.total_time = 0.0 # seconds
+
+    def __call__(self, args: list[str], address_book: AddressBook) -> str:
+        if len(args) < self.min_args:
+            return f"❌ Please enter enough arguments for the command! Usage: {self.usage}"
+        if self.max_args is not None and len(args) > self.max_args:
+            return f"❌ Too many arguments for the command! Usage: {self.usage}"
+        start = time.perf_counter()
+        try:
+            return self.handler(args, address_book)
+        finally:
+            self.calls += 1
+            self.total_time += time.perf_counter() - start
+
+COMMANDS: Final[dict[str, Command]] = {}
+
+def register_command(name: str, min_args: int = 0, max_args: int | None = None, usage: str = "") -> Callable:
+    # Decorator that adds a handler(args, address_book) -> str to COMMANDS.
+    # Plugins get this function passed to their register_commands() hook.
+    def decorator(handler: Callable) -> Callable:
+        COMMANDS[name] = Command(name, handler, min_args, max_args, usage)
+        return handler
+    return decorator
+
+def get_record(address_book: AddressBook, name: str) -> Record:
+    found_record = address_book.find(name)
+    if not found_record:
+        raise KeyError(f"❌ Contact '{name}' doesn't exists! Enter another name.")
+    return found_record
+
+@register_command("hello", max_args=0)
+def hello(args: list[str], address_book: AddressBook) -> str:
+    return "How can I help you?"
+
+@register_command("help", max_args=0)
+def show_help(args: list[str], address_book: AddressBook) -> str:
+    return '\n'.join(["Available commands:", *(f"  {command.usage}" for command in COMMANDS.values()), "  close | exit"])
+
+@register_command("stats", max_args=0)
+def show_stats(args: list[str], address_book: AddressBook) -> str:
+    lines = [f"{'Command':<15} | {'Calls':>8} | {'Total, ms':>10} | {'Avg, µs':>9}", "-" * 51]
+    for command in sorted(COMMANDS.values(), key=lambda c: c.total_time, reverse=True):
+        if command.calls:
+            lines.append(f"{command.name:<15} | {command.calls:>8} | {command.total_time * 1000:>10.2f} | "
+                         f"{command.total_time / command.calls * 1_000_000:>9.1f}")
+    return '\n'.join(lines)
+
+@register_command("add", min_args=2, usage="add <name> <phone>")
 @input_error
 def add_contact(args: list[str], address_book: AddressBook) -> str:
     name, phone, *_ = args
@@ -149,77 +899,1226 @@ def add_contact(args: list[str], address_book: AddressBook) -> str:
         record.add_phone(phone)
     return message
 
+@register_command("change", min_args=3, max_args=3, usage="change <name> <old phone> <new phone>")
 @input_error
 def change_contact(args: list[str], address_book: AddressBook) -> str:
-    name, old_phone, new_phone = args # raises ValueError if not enough arguments
-    found_record = address_book.find(name)
-    if not found_record:
-        raise KeyError(f"❌ Contact '{name}' doesn't exists! Enter another name.")
+    name, old_phone, new_phone = args
+    found_record = get_record(address_book, name)
     found_record.edit_phone(old_phone, new_phone)
     return f"✅ Contact '{name}' ws updated with the new phone: '{new_phone}'."
 
+@register_command("phone", min_args=1, max_args=1, usage="phone <name>")
 @input_error
-def show_phones(args: str, address_book: AddressBook) -> str:
-    name, = args # raises ValueError if no arguments provided
-    found_record = address_book.find(name)
-    if not found_record:
-        raise KeyError(f"❌ Contact '{name}' doesn't exists! Enter another name.")
+def show_phones(args: list[str], address_book: AddressBook) -> str:
+    name, = args
+    found_record = get_record(address_book, name)
     return ', '.join(p.value for p in found_record.phones)
 
+@register_command("find-by-phone", min_args=1, max_args=1, usage="find-by-phone <phone>")
 @input_error
-def show_all(address_book: AddressBook) -> list[str]:
-    return [f"{record}" for record in address_book.data.values()]
+def find_by_phone(args: list[str], address_book: AddressBook) -> str:
+    phone, = args
+    found_records = address_book.find_by_phone(Phone(phone).value)
+    if not found_records:
+        raise KeyError(f"❌ No contacts with the phone '{phone}'!")
+    return '\n'.join(str(record) for record in found_records)
 
-def print_all_contacts(address_book: AddressBook) -> None:
-    if address_book.data:
-        for i, contact in enumerate(show_all(address_book)):
-            print(f"{i + 1}. {contact}")
-    else:
-        print("No contacts to show!")
+CONTACT_SORT_KEYS: Final[dict[str, Callable | None]] = {
+    "added": None,
+    "name": lambda record: record.name.value.casefold(),
+    "birthday": lambda record: record._birthday or date.max.toordinal() + 1, # contacts without birthday go last
+}
+
+def iter_contacts(address_book: AddressBook, offset: int = 0, limit: int | None = None,
+                  sort: str = "added") -> Iterator[Record]:
+    # Streams records without building a list of the whole book: unsorted pages are
+    # sliced from the iterator, sorted pages keep only offset + limit records in a heap
+    records = address_book.iter_records()
+    sort_key = CONTACT_SORT_KEYS[sort]
+    if sort_key is not None:
+        if limit is None:
+            records = iter(sorted(records, key=sort_key))
+        else:
+            records = iter(heapq.nsmallest(offset + limit, records, key=sort_key))
+    return itertools.islice(records, offset, None if limit is None else offset + limit)
+
+@register_command("search", min_args=1, usage="search <name or its beginning>")
+def search_contacts(args: list[str], address_book: AddressBook) -> str:
+    found_records = address_book.search(' '.join(args))
+    if not found_records:
+        return f"No contacts matching '{' '.join(args)}'!"
+    return '\n'.join(f"{i + 1}. {record}" for i, record in enumerate(found_records))
+
+@register_command("all", max_args=3, usage=f"all [page] [page size] [{'|'.join(CONTACT_SORT_KEYS)}]")
+def list_all_contacts(args: list[str], address_book: AddressBook) -> str | Iterator[str]:
+    # Without arguments all contacts are streamed one line at a time
+    page, page_size, sort = None, DEFAULT_PAGE_SIZE, "added"
+    for position, arg in enumerate(args):
+        if arg.lower() in CONTACT_SORT_KEYS:
+            sort = arg.lower()
+        elif arg.isdigit() and int(arg) > 0 and position < 2:
+            if page is None:
+                page = int(arg)
+            else:
+                page_size = int(arg)
+        else:
+            return f"❌ Invalid argument '{arg}'! Usage: {COMMANDS['all'].usage}"
+    if not address_book.data:
+        return "No contacts to show!"
+
+    offset = (page - 1) * page_size if page else 0
+    limit = page_size if page else None
+    if offset >= len(address_book.data):
+        return f"❌ There is no page {page}, the last one is {-(-len(address_book.data) // page_size)}."
 
+    def lines() -> Iterator[str]:
+        for i, record in enumerate(iter_contacts(address_book, offset, limit, sort), start=offset + 1):
+            yield f"{i}. {record}"
+        if page:
+            pages_count = -(-len(address_book.data) // page_size)
+            yield f"-- page {page} of {pages_count} --"
+    return lines()
+
+@register_command("add-birthday", min_args=2, max_args=2, usage="add-birthday <name> <DD.MM.YYYY>")
 @input_error
 def add_birthday(args: list[str], address_book: AddressBook) -> str:
     name, birthday = args
-    found_record = address_book.find(name)
-    if not found_record:
-        raise KeyError(f"❌ Contact '{name}' doesn't exists! Enter another name.")
+    found_record = get_record(address_book, name)
     found_record.add_birthday(birthday)
     return f"✅ Contact '{name}' ws updated with birthday: '{birthday}'."
 
+@register_command("show-birthday", min_args=1, max_args=1, usage="show-birthday <name>")
 @input_error
 def show_birthday(args: list[str], address_book: AddressBook) -> str:
     name, = args
-    found_record = address_book.find(name)
-    if not found_record:
-        raise KeyError(f"❌ Contact '{name}' doesn't exists! Enter another name.")
-    return found_record.birthday
-
-def print_upcoming_birthdays(address_book: AddressBook):
-    if address_book.data:
-        upcoming_birthdays = address_book.get_upcoming_birthdays()
-        if upcoming_birthdays:
-            print(f"List of contacts with upcoming birthdays (next {NUMBER_OF_UPCOMING_DAYS} days):")
-            for i, (record, cong_date) in enumerate(upcoming_birthdays):
-                print(f"{i + 1}. {record.name} - birthday: {record.birthday}, congratulation date: {cong_date.strftime(DATE_FORMAT)}")
+    found_record = get_record(address_book, name)
+    return str(found_record.birthday)
+
+@register_command("birthdays", max_args=1, usage="birthdays [days]")
+def list_upcoming_birthdays(args: list[str], address_book: AddressBook) -> str:
+    days = NUMBER_OF_UPCOMING_DAYS
+    if args:
+        if not args[0].isdigit() or int(args[0]) > MAX_UPCOMING_DAYS:
+            return f"❌ Number of days should be a whole number from 0 to {MAX_UPCOMING_DAYS}!"
+        days = int(args[0])
+    if not address_book.data:
+        return "No contacts to show!"
+    upcoming_birthdays = address_book.get_upcoming_birthdays(days)
+    if not upcoming_birthdays:
+        return "No contacts with upcoming birthdays!"
+    lines = [f"List of contacts with upcoming birthdays (next {days} days):"]
+    for i, (record, cong_date) in enumerate(upcoming_birthdays):
+        lines.append(f"{i + 1}. {record.name} - birthday: {record.birthday}, congratulation date: {cong_date.strftime(DATE_FORMAT)}")
+    return '\n'.join(lines)
+
+def name_key(name: str) -> str:
+    # 'John_Smith', 'john.smith' and 'JohnSmith' get the same key
+    return NAME_KEY_IGNORED.sub('', name.casefold())
+
+def find_duplicates(address_book: AddressBook) -> tuple[dict[int, list[str]], dict[str, list[int]], list[list[str]]]:
+    # One pass over the book with hashed keys: the packed phone numbers and the name keys.
+    # Only the first owner of a key is remembered until a second one shows up,
+    # so the memory is spent on the duplicates rather than on the whole book.
+    # Returns phones shared by several contacts, phones repeated within one contact
+    # and groups of contacts with the same name key.
+    first_phone_owner, shared_phones = {}, {}
+    repeated_phones = {}
+    first_name_with_key, similar_names = {}, {}
+    for record in address_book.iter_records():
+        name = record.name.value
+        numbers = set()
+        for number in record._phones:
+            if number in numbers:
+                repeated_phones.setdefault(name, []).append(number)
+                continue
+            numbers.add(number)
+            owner = first_phone_owner.setdefault(number, name)
+            if owner != name:
+                shared_phones.setdefault(number, [owner]).append(name)
+        key = name_key(name)
+        first_name = first_name_with_key.setdefault(key, name)
+        if first_name != name:
+            similar_names.setdefault(key, [first_name]).append(name)
+    return shared_phones, repeated_phones, list(similar_names.values())
+
+@register_command("dedupe", max_args=0)
+def show_duplicates(args: list[str], address_book: AddressBook) -> str:
+    shared_phones, repeated_phones, similar_names = find_duplicates(address_book)
+    if not (shared_phones or repeated_phones or similar_names):
+        return "✅ No duplicates found!"
+    lines = []
+    if shared_phones:
+        lines.append("Phones shared by several contacts:")
+        lines.extend(f"  {Phone.from_number(number)}: {', '.join(names)}" for number, names in shared_phones.items())
+    if repeated_phones:
+        lines.append("Contacts with a phone listed more than once:")
+        lines.extend(f"  {name}: {', '.join(str(Phone.from_number(number)) for number in numbers)}"
+                     for name, numbers in repeated_phones.items())
+    if similar_names:
+        lines.append("Contacts that may be the same person:")
+        lines.extend(f"  {', '.join(names)}" for names in similar_names)
+    return '\n'.join(lines)
+
+PHONE_PATTERN: Final[re.Pattern] = re.compile(rf'[0-9]{{{PHONE_LENGTH}}}')
+
+def validate_phones(phones: list[str]) -> list[int]:
+    # Validates a row of phones with one precompiled pattern and returns their packed form
+    numbers = []
+    for phone in phones:
+        if PHONE_PATTERN.fullmatch(phone) is None:
+            numbers.append(Phone(phone).number) # normalizes the phone or raises PhoneFormatError
         else:
-            print("No contacts with upcoming birthdays!")
+            numbers.append(int(phone))
+    return numbers
+
+@functools.lru_cache(maxsize=65536)
+def birthday_ordinal(date_str: str) -> int:
+    # Imported books repeat the same dates a lot, so parsed dates are cached
+    return Birthday(date_str).value.toordinal()
+
+def read_contact_rows(file, file_format: str):
+    # Yields (line number, raw row, contact dict or None when the row can't be parsed)
+    if file_format == "csv":
+        reader = csv.reader(file)
+        for row in reader:
+            if row == CSV_HEADER or not row:
+                continue
+            name, phones, birthday, *_ = row + ['', '', '']
+            phones = [p.strip() for p in phones.split(CSV_PHONES_SEPARATOR) if p.strip()]
+            yield reader.line_num, ','.join(row), {"name": name.strip(), "phones": phones, "birthday": birthday.strip()}
     else:
-        print("No contacts to show!")
+        for line_number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+            except ValueError:
+                data = None
+            yield line_number, line.rstrip("\n"), data if isinstance(data, dict) else None
+
+def import_contacts(filename: str, address_book: AddressBook) -> tuple[int, list[tuple]]:
+    # Streams the file in chunks of IMPORT_CHUNK_SIZE rows: every chunk is validated
+    # first, then new contacts are added with one add_records() call.
+    # Returns the number of imported rows and the (line, row, reason) of rejected ones.
+    file_format = "csv" if filename.lower().endswith(".csv") else "jsonl"
+    imported = 0
+    rejected = []
+    with open(filename, "r", encoding="utf-8", newline="") as f:
+        rows = read_contact_rows(f, file_format)
+        while chunk := list(itertools.islice(rows, IMPORT_CHUNK_SIZE)):
+            new_records = {}
+            for line_number, raw_row, data in chunk:
+                try:
+                    if data is None:
+                        raise ValueError("❌ Row can't be parsed!")
+                    name = str(data.get("name") or "").strip()
+                    if not name:
+                        raise ValueError("❌ Contact name is missing!")
+                    numbers = validate_phones([str(p) for p in data.get("phones") or []])
+                    ordinal = birthday_ordinal(data["birthday"]) if data.get("birthday") else 0
+                except (ValueError, PhoneFormatError) as e:
+                    rejected.append((line_number, raw_row, e.args[0]))
+                    continue
+
+                record = new_records.get(name) or address_book.data.get(name)
+                if record is None:
+                    record = Record(name)
+                    new_records[name] = record
+                if record._book is None: # not in the book yet, so no change notifications needed
+                    for number in numbers:
+                        if number not in record._phones:
+                            record._phones.append(number)
+                    record._birthday = ordinal or record._birthday
+                else:
+                    for number in numbers:
+                        if number not in record._phones:
+                            record.add_phone(Phone.from_number(number).value)
+                    if ordinal:
+                        record.add_birthday(str(Birthday.from_ordinal(ordinal)))
+                imported += 1
+            if new_records:
+                address_book.add_records(list(new_records.values()))
+    return imported, rejected
+
+def export_contacts(filename: str, address_book: AddressBook) -> int:
+    # Writes the contacts in chunks of IMPORT_CHUNK_SIZE rows in the format chosen by the file extension
+    exported = 0
+    with open(filename, "w", encoding="utf-8", newline="") as f:
+        if filename.lower().endswith(".csv"):
+            writer = csv.writer(f)
+            writer.writerow(CSV_HEADER)
+            write_chunk = lambda rows: writer.writerows(
+                [d["name"], CSV_PHONES_SEPARATOR.join(d["phones"]), d["birthday"] or ""] for d in rows)
+        else:
+            write_chunk = lambda rows: f.writelines(json.dumps(d, ensure_ascii=False) + "\n" for d in rows)
+        records = address_book.iter_records()
+        while chunk := [record_to_dict(record) for record in itertools.islice(records, IMPORT_CHUNK_SIZE)]:
+            write_chunk(chunk)
+            exported += len(chunk)
+    return exported
+
+@register_command("import", min_args=1, max_args=1, usage="import <file.csv|file.jsonl>")
+@input_error
+def import_file(args: list[str], address_book: AddressBook) -> str:
+    filename, = args
+    try:
+        imported, rejected = import_contacts(filename, address_book)
+    except OSError as e:
+        return f"❌ Can't read the file '{filename}': {e.strerror}"
+    lines = [f"✅ Imported {imported} row(s) from '{filename}', rejected {len(rejected)}."]
+    if rejected:
+        for line_number, raw_row, reason in rejected[:IMPORT_REJECTED_PREVIEW]:
+            lines.append(f"  line {line_number}: {raw_row} - {reason}")
+        rejected_filename = filename + ".rejected"
+        with open(rejected_filename, "w", encoding="utf-8") as f:
+            f.writelines(f"{line_number}\t{raw_row}\t{reason}\n" for line_number, raw_row, reason in rejected)
+        lines.append(f"All rejected rows were written to '{rejected_filename}'.")
+    return '\n'.join(lines)
+
+@register_command("export", min_args=1, max_args=1, usage="export <file.csv|file.jsonl>")
+@input_error
+def export_file(args: list[str], address_book: AddressBook) -> str:
+    filename, = args
+    try:
+        exported = export_contacts(filename, address_book)
+    except OSError as e:
+        return f"❌ Can't write the file '{filename}': {e.strerror}"
+    return f"✅ Exported {exported} contact(s) to '{filename}'."
+
+# Commands working with the undo history itself, their changes are not recorded as a step
+HISTORY_COMMANDS: Final[set[str]] = {"undo", "redo", "begin", "commit", "rollback"}
+
+def get_history(address_book: AddressBook) -> History:
+    if address_book.history is None:
+        raise KeyError("❌ Undo history is not enabled for this address book!")
+    return address_book.history
+
+@register_command("undo", max_args=0)
+@input_error
+def undo(args: list[str], address_book: AddressBook) -> str:
+    history = get_history(address_book)
+    if history.in_transaction:
+        return "❌ Commit or rollback the transaction first!"
+    return "✅ Last change was undone." if history.undo() else "❌ Nothing to undo!"
+
+@register_command("redo", max_args=0)
+@input_error
+def redo(args: list[str], address_book: AddressBook) -> str:
+    history = get_history(address_book)
+    if history.in_transaction:
+        return "❌ Commit or rollback the transaction first!"
+    return "✅ Last undone change was redone." if history.redo() else "❌ Nothing to redo!"
+
+@register_command("begin", max_args=0)
+@input_error
+def begin_transaction(args: list[str], address_book: AddressBook) -> str:
+    history = get_history(address_book)
+    if history.in_transaction:
+        return "❌ Transaction is already started!"
+    history.begin()
+    return "✅ Transaction started: the next commands can be committed or rolled back together."
+
+@register_command("commit", max_args=0)
+@input_error
+def commit_transaction(args: list[str], address_book: AddressBook) -> str:
+    history = get_history(address_book)
+    if not history.in_transaction:
+        return "❌ There is no transaction to commit!"
+    return f"✅ Transaction committed with {history.commit()} change(s)."
+
+@register_command("rollback", max_args=0)
+@input_error
+def rollback_transaction(args: list[str], address_book: AddressBook) -> str:
+    history = get_history(address_book)
+    if not history.in_transaction:
+        return "❌ There is no transaction to roll back!"
+    changes = history.rollback()
+    if changes is None:
+        return "❌ Transaction was too big to keep its history, its changes stay in the book!"
+    return f"✅ Transaction rolled back, {changes} change(s) undone."
+
+# Address book file layout, version 2:
+#   header: magic, format version, generation, last journal sequence number, number of records
+#   records: encode_record() blobs written one after another
+# The generation grows with every save, so a process can tell whether
+# somebody else has saved the file since it was loaded.
+# Version 1 files have the same layout without the generation.
+BOOK_MAGIC: Final[bytes] = b'ABKB'
+BOOK_FORMAT_VERSION: Final[int] = 2
+BOOK_HEADER: Final[struct.Struct] = struct.Struct('<4sHQQI')
+BOOK_HEADER_V1: Final[struct.Struct] = struct.Struct('<4sHQI')
+# Records encoded before they are written to the file at once
+BOOK_WRITE_CHUNK_SIZE: Final[int] = 10_000
+
+def encode_book(address_book: AddressBook):
+    # Yields the file content in chunks, so the whole file is never built in memory
+    yield BOOK_HEADER.pack(BOOK_MAGIC, BOOK_FORMAT_VERSION, address_book.generation,
+                           address_book.journal_seq, len(address_book.data))
+    records = address_book.iter_records()
+    while chunk := list(itertools.islice(records, BOOK_WRITE_CHUNK_SIZE)):
+        yield b"".join(encode_record(record) for record in chunk)
+
+def decode_book_header(content: bytes) -> tuple[int, int, int, int]:
+    # Returns (generation, journal sequence number, number of records, offset of the first record)
+    magic, version = struct.unpack_from('<4sH', content, 0)
+    if magic != BOOK_MAGIC:
+        raise ValueError("❌ File is not an address book!")
+    if version > BOOK_FORMAT_VERSION:
+        raise ValueError(f"❌ Address book format version {version} is newer than this bot supports!")
+    if version == 1:
+        _, _, journal_seq, count = BOOK_HEADER_V1.unpack_from(content, 0)
+        return 0, journal_seq, count, BOOK_HEADER_V1.size
+    _, _, generation, journal_seq, count = BOOK_HEADER.unpack_from(content, 0)
+    return generation, journal_seq, count, BOOK_HEADER.size
+
+def decode_book(content: bytes) -> AddressBook:
+    try:
+        generation, journal_seq, count, offset = decode_book_header(content)
+        address_book = AddressBook()
+        address_book.generation = generation
+        address_book.journal_seq = journal_seq
+        data = address_book.data
+        # Every object created here stays alive, so the garbage collector
+        # passes triggered by the allocations would only slow the loading down
+        gc.disable()
+        for _ in range(count):
+            # Slicing past the end doesn't fail, so a file cut inside a record is caught here
+            if offset + record_size(content, offset) > len(content):
+                raise ValueError("❌ Address book file is corrupted!")
+            record, offset = decode_record(content, offset)
+            record._book = address_book
+            data[record.name.value] = record
+        if offset != len(content):
+            raise ValueError("❌ Address book file is corrupted!") # trailing bytes after the last record
+    except (struct.error, UnicodeDecodeError):
+        raise ValueError("❌ Address book file is corrupted!") from None
+    finally:
+        gc.enable()
+    return address_book
+
+def replace_file(filename: str, write: Callable) -> None:
+    # The new content is written next to the file and renamed over it, so a crash
+    # in the middle of a save leaves either the old or the new file, never a torn one
+    temp_filename = f"{filename}.{os.getpid()}.tmp"
+    try:
+        with open(temp_filename, "wb") as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_filename, filename)
+    except BaseException:
+        try:
+            os.remove(temp_filename)
+        except OSError:
+            pass
+        raise
 
 def save_data(address_book, filename):
-    with open(filename, "wb") as f:
-        pickle.dump(address_book, f)
+    replace_file(filename, lambda f: f.writelines(encode_book(address_book)))
 
-def load_data(filename: str):
+def read_book_generation(filename: str) -> int:
+    # Reads only the file header, 0 when the book was never saved
     try:
         with open(filename, "rb") as f:
-            return pickle.load(f)
+            return decode_book_header(f.read(BOOK_HEADER.size))[0]
+    except FileNotFoundError:
+        return 0
+    except struct.error:
+        raise ValueError("❌ Address book file is corrupted!") from None
+
+def load_data(filename: str, legacy_filename: str = LEGACY_ADDRESS_BOOK_FILE_NAME):
+    try:
+        with open(filename, "rb") as f:
+            return decode_book(f.read())
+    except FileNotFoundError:
+        pass
+    try:
+        # Migration path: the pickle written by the earlier versions of the bot
+        # is read once and saved in the binary format on the next save
+        with open(legacy_filename, "rb") as f:
+            address_book = pickle.load(f)
+        address_book.changes = len(address_book.data)
+        return address_book
     except FileNotFoundError:
         # when open for the first time
         return AddressBook()
 
+class FileLock:
+    # Advisory lock held on a separate '<file>.lock' file while the file is read
+    # or written, so bot processes sharing one book take turns. It is reentrant
+    # within a process: the journal compaction saves the book while holding it.
+    def __init__(self, filename: str):
+        self.filename = filename + ".lock"
+        self._file = None
+        self._depth = 0
+
+    def __enter__(self) -> FileLock:
+        if self._depth == 0:
+            self._file = open(self.filename, "a+b")
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            elif msvcrt is not None:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._depth -= 1
+        if self._depth == 0:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            elif msvcrt is not None:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+            self._file.close()
+            self._file = None
+
+class Journal:
+    # Append-only log of address book changes, one JSON array per line:
+    # [sequence number, operation, contact name, *operation arguments]
+    # Several processes may append to the same journal, so it is always
+    # read from the position this process has seen last.
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.entries = 0 # entries in the journal since the last compaction
+        self.position = 0 # size of the journal part already applied to the book
+        self._file = None
+
+    def replay(self, address_book: AddressBook) -> int:
+        applied = 0
+        try:
+            with open(self.filename, "rb") as f:
+                f.seek(self.position)
+                for line in f:
+                    try:
+                        seq, operation, name, *args = json.loads(line)
+                    except ValueError:
+                        # Torn last line after a crash, everything before it is valid.
+                        # It is cut off, so the next entry starts on a line of its own.
+                        os.truncate(self.filename, self.position)
+                        break
+                    self.position += len(line)
+                    self.entries += 1
+                    if seq <= address_book.journal_seq:
+                        continue # already included in the snapshot
+                    address_book.apply(operation, name, *args)
+                    address_book.journal_seq = seq
+                    applied += 1
+        except FileNotFoundError:
+            pass
+        return applied
+
+    def append(self, seq: int, operation: str, name: str, *args) -> None:
+        if self._file is None:
+            self._file = open(self.filename, "ab")
+        line = (json.dumps([seq, operation, name, *args], ensure_ascii=False) + "\n").encode("utf-8")
+        self._file.write(line)
+        self._file.flush()
+        self.position += len(line)
+        self.entries += 1
+
+    def truncate(self) -> None:
+        self.close()
+        open(self.filename, "w").close()
+        self.entries = 0
+        self.position = 0
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+class FileStorage:
+    # Saves the whole address book into a single binary file. Changes made since
+    # the book was loaded are remembered, so when another process has saved the
+    # file in the meantime they are re-applied on top of its version instead of
+    # overwriting it.
+    def __init__(self, filename: str = ADDRESS_BOOK_FILE_NAME):
+        self.filename = filename
+        self.lock = FileLock(filename)
+        self.pending_changes = []
+
+    def load(self) -> AddressBook:
+        with self.lock:
+            address_book = load_data(self.filename)
+        address_book.subscribe(lambda *change: self.pending_changes.append(change))
+        return address_book
+
+    def save(self, address_book: AddressBook) -> None:
+        if not address_book.is_dirty():
+            return
+        with self.lock:
+            if read_book_generation(self.filename) != address_book.generation:
+                self._rebase(address_book)
+            address_book.generation += 1
+            save_data(address_book, self.filename)
+            self.pending_changes.clear()
+            address_book.mark_clean()
+
+    def _rebase(self, address_book: AddressBook) -> None:
+        fresh_book = load_data(self.filename)
+        for operation, name, *args in self.pending_changes:
+            try:
+                fresh_book.apply(operation, name, *args)
+            except (KeyError, ValueError, PhoneFormatError) as e:
+                # e.g. a phone added to a contact the other process has deleted
+                print(f"⚠️ Change '{operation}' of '{name}' conflicts with a newer version of the book "
+                      f"and was dropped: {e}", file=sys.stderr)
+        address_book.replace_contents(fresh_book)
+
+class JournalStorage(FileStorage):
+    # Appends every change to the journal and only rewrites the book snapshot
+    # once the journal grows over the compaction threshold. Every command runs
+    # under the lock on top of the entries written by other processes, so the
+    # sequence numbers stay unique across all processes sharing the journal.
+    def __init__(self, filename: str = ADDRESS_BOOK_FILE_NAME, journal_filename: str = JOURNAL_FILE_NAME,
+                 compaction_threshold: int = JOURNAL_COMPACTION_THRESHOLD):
+        super().__init__(filename)
+        self.journal = Journal(journal_filename)
+        self.compaction_threshold = compaction_threshold
+
+    def load(self) -> AddressBook:
+        with self.lock:
+            address_book = load_data(self.filename)
+            self.journal.replay(address_book)
+        address_book.subscribe(lambda *change: self._on_change(address_book, *change))
+        address_book.command_context = lambda: self._running_command(address_book)
+        return address_book
+
+    @contextmanager
+    def _running_command(self, address_book: AddressBook):
+        # The book is brought up to date before the command, not in the middle of it:
+        # a reload would swap the records its handler holds, and the changes made to
+        # them afterwards would be journaled but missing from the book
+        with self.lock:
+            self._catch_up(address_book)
+            yield
+
+    def _catch_up(self, address_book: AddressBook) -> bool:
+        # Must be called under the lock, returns True when the book was reloaded
+        # The entries of other processes must not reach the listeners:
+        # the undo history would take them for a part of the running command
+        reloaded = read_book_generation(self.filename) != address_book.generation
+        with address_book.replaying_changes():
+            if reloaded:
+                # Another process has compacted the journal: every change of this
+                # process is in its snapshot or journal already, so the book is reloaded
+                address_book.replace_contents(load_data(self.filename))
+                self.journal.close()
+                self.journal.entries = self.journal.position = 0
+            self.journal.replay(address_book)
+        return reloaded
+
+    def _on_change(self, address_book: AddressBook, operation: str, name: str, *args) -> None:
+        # Changes are made inside _running_command(), so the book is up to date here
+        with self.lock:
+            address_book.journal_seq += 1
+            self.journal.append(address_book.journal_seq, operation, name, *args)
+            if self.journal.entries >= self.compaction_threshold:
+                self.compact(address_book)
+
+    def compact(self, address_book: AddressBook) -> None:
+        # The snapshot remembers the last journal sequence number, so a crash
+        # between these two steps never replays the same change twice
+        with self.lock:
+            self._catch_up(address_book)
+            address_book.generation += 1
+            save_data(address_book, self.filename)
+            self.journal.truncate()
+
+    def save(self, address_book: AddressBook) -> None:
+        # Every change is in the journal already, only the compaction may be due
+        with self.lock:
+            if self.journal.entries >= self.compaction_threshold:
+                self.compact(address_book)
+        address_book.mark_clean()
+
+class LazyRecordStore(MutableMapping):
+    # Read-mostly mapping over a memory-mapped record file. Layout:
+    #   header: magic, format version, number of records, offset of the index
+    #   records: encode_record() blobs written one after another
+    #   index: (name hash, record offset, record length) entries sorted by hash
+    # Records are decoded only on access; changed, new and deleted records live
+    # in memory until the store is written back with save().
+    MAGIC: Final[bytes] = b'ABKL'
+    VERSION: Final[int] = 2
+    HEADER: Final[struct.Struct] = struct.Struct('<4sHQQ')
+    INDEX_ENTRY: Final[struct.Struct] = struct.Struct('<QQI')
+
+    def __init__(self, filename: str, on_load: Callable[[Record], None] | None = None):
+        self.filename = filename
+        self.on_load = on_load # called for every record materialized from the file
+        self.loaded = {} # records materialized from the file or added in memory
+        self.deleted = set() # names removed from the file since the last save
+        self.added = {} # names that are not in the file at all, in insertion order
+        self.dirty = set() # names that have to be re-encoded on save
+        self._file = None
+        self._mmap = None
+        self._count = 0
+        self._index_offset = 0
+        self.version = None # _file_version() of the opened file
+        self._open()
+
+    def _open(self) -> None:
+        try:
+            self._file = open(self.filename, "rb")
+        except FileNotFoundError:
+            self.version = None
+            return
+        self.version = self._file_version()
+        if os.fstat(self._file.fileno()).st_size < self.HEADER.size:
+            self.close()
+            raise ValueError(f"❌ Address book file '{self.filename}' is corrupted!")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self._count, self._index_offset = self.HEADER.unpack_from(self._mmap, 0)
+        if magic != self.MAGIC or version != self.VERSION:
+            self.close()
+            raise ValueError(f"❌ '{self.filename}' is not a supported address book file!")
+        # The index ends the file: a file cut short would make the lookups read past its end
+        if (self._index_offset < self.HEADER.size
+                or self._index_offset + self._count * self.INDEX_ENTRY.size != len(self._mmap)):
+            self.close()
+            raise ValueError(f"❌ Address book file '{self.filename}' is corrupted!")
+
+    def close(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._count = 0
+
+    @staticmethod
+    def name_hash(name: str) -> int:
+        # Stable across processes, unlike the built-in hash() of a string
+        return int.from_bytes(hashlib.blake2b(name.encode("utf-8"), digest_size=8).digest(), "little")
+
+    def _index_entry(self, position: int) -> tuple[int, int, int]:
+        return self.INDEX_ENTRY.unpack_from(self._mmap, self._index_offset + position * self.INDEX_ENTRY.size)
+
+    def _find_offset(self, name: str) -> int | None:
+        if self._mmap is None:
+            return None
+        target = self.name_hash(name)
+        low, high = 0, self._count
+        while low < high: # binary search of the first entry with the target hash
+            middle = (low + high) // 2
+            if self._index_entry(middle)[0] < target:
+                low = middle + 1
+            else:
+                high = middle
+        while low < self._count:
+            entry_hash, offset, _ = self._index_entry(low)
+            if entry_hash != target:
+                break
+            if decode_record_name(self._mmap, offset) == name:
+                return offset
+            low += 1 # hash collision, check the next entry
+        return None
+
+    def _file_records(self):
+        # Walks the records in the order they were written, yielding (name, offset, length)
+        offset = self.HEADER.size
+        while offset < self._index_offset:
+            length = record_size(self._mmap, offset)
+            yield decode_record_name(self._mmap, offset), offset, length
+            offset += length
+
+    def __getitem__(self, name: str) -> Record:
+        if name in self.loaded:
+            return self.loaded[name]
+        if name in self.deleted:
+            raise KeyError(name)
+        offset = self._find_offset(name)
+        if offset is None:
+            raise KeyError(name)
+        record, _ = decode_record(self._mmap, offset)
+        self.loaded[name] = record
+        if self.on_load:
+            self.on_load(record)
+        return record
+
+    def __setitem__(self, name: str, record: Record) -> None:
+        if name not in self.loaded and name not in self.deleted and self._find_offset(name) is None:
+            self.added[name] = None
+        self.deleted.discard(name)
+        self.loaded[name] = record
+        self.dirty.add(name)
+
+    def __delitem__(self, name: str) -> None:
+        if name in self.added:
+            del self.added[name]
+        elif name in self.deleted or self._find_offset(name) is None:
+            raise KeyError(name)
+        else:
+            self.deleted.add(name)
+        self.loaded.pop(name, None)
+        self.dirty.discard(name)
+
+    def __contains__(self, name) -> bool:
+        if name in self.loaded:
+            return True
+        return name not in self.deleted and self._find_offset(name) is not None
+
+    def __iter__(self):
+        for name, _, _ in self._file_records():
+            if name not in self.deleted:
+                yield name
+        yield from self.added
+
+    def __len__(self) -> int:
+        return self._count - len(self.deleted) + len(self.added)
+
+    def iter_records(self) -> Iterator[Record]:
+        # Records that were not materialized yet are decoded for the caller only,
+        # so walking the whole book doesn't pull it into memory
+        for name, offset, _ in self._file_records():
+            if name in self.loaded:
+                yield self.loaded[name]
+            elif name not in self.deleted:
+                yield decode_record(self._mmap, offset)[0]
+        for name in self.added:
+            yield self.loaded[name]
+
+    def is_modified(self) -> bool:
+        return bool(self.dirty or self.deleted)
+
+    def _file_version(self) -> tuple | None:
+        # Every save replaces the file, so a new inode or size means another process has saved it
+        try:
+            file_stat = os.stat(self.filename)
+        except FileNotFoundError:
+            return None
+        return file_stat.st_ino, file_stat.st_size, file_stat.st_mtime_ns
+
+    def _rebase(self) -> None:
+        # Re-opens the file saved by another process: the in-memory changes of this
+        # process stay on top of it, the records they don't touch come from the new file
+        self.close()
+        self._open()
+        for name in list(self.added):
+            if self._find_offset(name) is not None:
+                del self.added[name]
+        for name in list(self.deleted):
+            if self._find_offset(name) is None:
+                self.deleted.discard(name)
+        for name in self.dirty:
+            if self._find_offset(name) is None:
+                self.added[name] = None # changed here, deleted by the other process
+
+    def save(self) -> None:
+        # Must be called under the store lock. Unchanged records are copied from
+        # the old file as raw bytes without being decoded, so saving costs
+        # O(file size), not O(objects)
+        if self._file_version() != self.version:
+            self._rebase()
+        entries = []
+
+        def write_file(f) -> None:
+            f.write(self.HEADER.pack(self.MAGIC, self.VERSION, 0, 0))
+            offset = self.HEADER.size
+
+            def write(name: str, blob) -> None:
+                nonlocal offset
+                f.write(blob)
+                entries.append((self.name_hash(name), offset, len(blob)))
+                offset += len(blob)
+
+            for name, record_offset, length in self._file_records():
+                if name in self.deleted:
+                    continue
+                if name in self.dirty:
+                    write(name, encode_record(self.loaded[name]))
+                else:
+                    write(name, self._mmap[record_offset:record_offset + length])
+            for name in self.added:
+                write(name, encode_record(self.loaded[name]))
+
+            entries.sort()
+            for entry in entries:
+                f.write(self.INDEX_ENTRY.pack(*entry))
+            f.seek(0)
+            f.write(self.HEADER.pack(self.MAGIC, self.VERSION, len(entries), offset))
+
+        replace_file(self.filename, write_file)
+        self.close()
+        self.deleted.clear()
+        self.added.clear()
+        self.dirty.clear()
+        self._open()
+
+class LazyAddressBook(AddressBook):
+    # Address book backed by LazyRecordStore: startup only maps the file,
+    # records are materialized when a command touches them
+    def __init__(self, filename: str = LAZY_BOOK_FILE_NAME):
+        super().__init__()
+        self.data = LazyRecordStore(filename, on_load=self._bind)
+        self.subscribe(lambda operation, name, *args: self._track_change(operation, name))
+
+    def _bind(self, record: Record) -> None:
+        record._book = self
+
+    def iter_records(self) -> Iterator[Record]:
+        return self.data.iter_records()
+
+    def _track_change(self, operation: str, name: str) -> None:
+        if operation != "delete" and name in self.data.loaded:
+            self.data.dirty.add(name)
+
+class LazyStorage:
+    # Keeps records in the memory-mapped LAZY_BOOK_FILE_NAME file. When only the
+    # whole-book file exists yet, its contents are migrated on the first save.
+    def __init__(self, filename: str = LAZY_BOOK_FILE_NAME, legacy_filename: str = ADDRESS_BOOK_FILE_NAME):
+        self.filename = filename
+        self.legacy_filename = legacy_filename
+        self.lock = FileLock(filename)
+
+    def load(self) -> AddressBook:
+        with self.lock:
+            address_book = LazyAddressBook(self.filename)
+            if not os.path.exists(self.filename):
+                for record in load_data(self.legacy_filename).data.values():
+                    address_book.add_record(record)
+        return address_book
+
+    def save(self, address_book: LazyAddressBook) -> None:
+        if address_book.data.is_modified():
+            with self.lock:
+                address_book.data.save()
+        address_book.mark_clean()
+
+class AutoSaver(threading.Thread):
+    # Saves the book in the background every `interval` seconds, or as soon as
+    # `max_changes` changes were made. Clean books are not written at all.
+    def __init__(self, storage, address_book: AddressBook,
+                 interval: float = AUTOSAVE_INTERVAL, max_changes: int = AUTOSAVE_MAX_CHANGES):
+        super().__init__(name="autosave", daemon=True)
+        self.storage = storage
+        self.address_book = address_book
+        self.interval = interval
+        self.max_changes = max_changes
+        self.saves = 0
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        address_book.subscribe(self._on_change)
+
+    def _on_change(self, operation: str, name: str, *args) -> None:
+        if self.address_book.changes >= self.max_changes:
+            self._wakeup.set()
+
+    def run(self) -> None:
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self) -> None:
+        with self.address_book.lock:
+            if not self.address_book.is_dirty():
+                return
+            try:
+                self.storage.save(self.address_book)
+                self.saves += 1
+            except (OSError, ValueError) as e:
+                print(f"\n⚠️ Autosave to '{self.storage.filename}' failed: {e}", file=sys.stderr)
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._wakeup.set()
+        self.join()
+
+STORAGE_BACKENDS: Final[dict[str, type]] = {
+    "file": FileStorage,
+    "journal": JournalStorage,
+    "lazy": LazyStorage,
+}
+
+def parse_cmd_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Assistant bot with a persistent address book.")
+    parser.add_argument(
+        '--storage',
+        choices=STORAGE_BACKENDS.keys(),
+        default='file',
+        help=(
+            "How the address book is persisted: 'file' rewrites the whole book file on exit, "
+            "'journal' appends every change to a log and compacts it periodically, "
+            "'lazy' memory-maps the book file and loads contacts on demand."
+        )
+    )
+    parser.add_argument(
+        '--import',
+        dest='import_path',
+        metavar='FILE',
+        help="Import contacts from a CSV or JSON Lines file, save the book and exit."
+    )
+    parser.add_argument(
+        '--export',
+        dest='export_path',
+        metavar='FILE',
+        help="Export all contacts to a CSV or JSON Lines file and exit."
+    )
+    parser.add_argument(
+        '--batch',
+        nargs='?',
+        const='-',
+        metavar='FILE',
+        help="Execute commands from FILE (or from stdin when FILE is omitted or '-') without prompts and exit."
+    )
+    parser.add_argument(
+        '--serve',
+        nargs='?',
+        const=f"127.0.0.1:{DEFAULT_SERVER_PORT}",
+        metavar='ADDRESS',
+        help=(
+            f"Serve the address book to many clients over TCP (HOST:PORT, default 127.0.0.1:{DEFAULT_SERVER_PORT}) "
+            "or a Unix socket (unix:PATH) until Ctrl+C, then save it."
+        )
+    )
+    parser.add_argument(
+        '--plugin',
+        action='append',
+        default=[],
+        metavar='MODULE',
+        help="Import MODULE and let it register extra commands (can be repeated)."
+    )
+    parser.add_argument(
+        '--autosave',
+        type=float,
+        default=AUTOSAVE_INTERVAL,
+        metavar='SECONDS',
+        help=(
+            f"Save the book in the background every SECONDS (default {AUTOSAVE_INTERVAL:g}) in the interactive "
+            "and server modes, 0 disables the autosave."
+        )
+    )
+    parser.add_argument(
+        '--autosave-changes',
+        type=int,
+        default=AUTOSAVE_MAX_CHANGES,
+        metavar='N',
+        help=f"Also autosave as soon as N changes were made (default {AUTOSAVE_MAX_CHANGES})."
+    )
+    return parser.parse_args()
+
+def run_command(command: str, args: list[str], address_book: AddressBook,
+                session: HistorySession | None = None) -> str | Iterable[str]:
+    # Long outputs are returned as an iterator of lines, see result_lines().
+    # The session is the undo history state of the client running the command.
+    registered_command = COMMANDS.get(command)
+    if registered_command is None:
+        return "❌ Invalid or empty command!"
+    # The autosave doesn't write the book in the middle of a command
+    with address_book.lock, address_book.command_context():
+        history = address_book.history
+        if history is None:
+            result = registered_command(args, address_book)
+        else:
+            with history.using(session) if session is not None else nullcontext():
+                if command in HISTORY_COMMANDS:
+                    result = registered_command(args, address_book)
+                else:
+                    with history.command():
+                        result = registered_command(args, address_book)
+    return result if isinstance(result, str) else locked_lines(result, address_book.lock)
+
+def locked_lines(lines: Iterable[str], lock) -> Iterator[str]:
+    # Streamed output reads the book while it is consumed, after the command has
+    # returned, so the lock is held until the last line: a background save in the
+    # middle would e.g. re-map the lazy book file under the running iterator
+    with lock:
+        yield from lines
+
+def rollback_session(address_book: AddressBook, session: HistorySession) -> bool:
+    # Rolls back the transaction a client has left open, returns whether there was one
+    with address_book.lock, address_book.command_context():
+        if address_book.history is None or not session.in_transaction:
+            return False
+        with address_book.history.using(session):
+            address_book.history.rollback()
+        return True
+
+def result_lines(result: str | Iterable[str]) -> Iterable[str]:
+    return (result,) if isinstance(result, str) else result
+
+def load_plugins(module_names: list[str]) -> None:
+    # A plugin is an importable module with a register_commands(register_command) function
+    for module_name in module_names:
+        try:
+            module = importlib.import_module(module_name)
+            module.register_commands(register_command)
+        except (ImportError, AttributeError) as e:
+            print(f"❌ Can't load the plugin '{module_name}': {e}", file=sys.stderr)
+
+def run_batch(commands_file, address_book: AddressBook, output=sys.stdout) -> int:
+    # Executes one command per line without prompts. Empty lines and lines starting
+    # with '#' are skipped, 'close'/'exit' stops the batch. Output is collected and
+    # written in blocks of BATCH_OUTPUT_BUFFER_SIZE lines. Returns the number of executed commands.
+    buffer = []
+    executed = 0
+    for line in commands_file:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        command, *args = parse_input(line)
+        if command in ["close", "exit"]:
+            break
+        for output_line in result_lines(run_command(command, args, address_book)):
+            buffer.append(output_line)
+            buffer.append("\n")
+            if len(buffer) >= BATCH_OUTPUT_BUFFER_SIZE:
+                output.writelines(buffer)
+                buffer.clear()
+        executed += 1
+    output.writelines(buffer)
+    output.flush()
+    return executed
+
+class BookServer:
+    # Serves one address book to many clients over TCP or a Unix socket.
+    # The protocol is the one of the interactive bot: one command per line,
+    # every response is followed by an empty line, 'close'/'exit' ends the session.
+    # Commands run one at a time in a worker thread, so a long import or export
+    # doesn't stop the server from accepting and reading other connections.
+    def __init__(self, address_book: AddressBook):
+        self.address_book = address_book
+        self.lock = asyncio.Lock()
+        self.connections = {} # writer -> HistorySession of every connected client
+
+    def _run_command(self, command: str, args: list[str], session: HistorySession) -> str:
+        return '\n'.join(result_lines(run_command(command, args, self.address_book, session)))
+
+    async def execute(self, command: str, args: list[str], session: HistorySession) -> str:
+        async with self.lock:
+            return await asyncio.to_thread(self._run_command, command, args, session)
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        session = HistorySession() # 'begin' of this client doesn't group the commands of the others
+        self.connections[writer] = session
+        try:
+            try:
+                writer.write("Welcome to the assistant bot!\n\n".encode("utf-8"))
+                await writer.drain()
+                while line := await reader.readline():
+                    command, *args = parse_input(line.decode("utf-8", errors="replace").strip())
+                    if command in ["close", "exit"]:
+                        writer.write("Good bye!\n\n".encode("utf-8"))
+                        break
+                    response = await self.execute(command, args, session)
+                    writer.write(f"{response}\n\n".encode("utf-8"))
+                    await writer.drain()
+            except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+                pass # client went away or sent a line that is too long
+            # Like in a database, the transaction of a client that has disconnected is not kept
+            async with self.lock:
+                if await asyncio.to_thread(rollback_session, self.address_book, session):
+                    print("⚠️ Transaction of a disconnected client wasn't committed and was rolled back.")
+        except asyncio.CancelledError:
+            pass # the server is stopping, close_connections() has rolled the transaction back
+        finally:
+            self.connections.pop(writer, None)
+            writer.close()
+
+    def close_connections(self) -> None:
+        # Called when the server stops: the open transactions are rolled back and the clients
+        # are disconnected, so the shutdown doesn't wait for clients that stay connected
+        for writer, session in list(self.connections.items()):
+            if rollback_session(self.address_book, session):
+                print("⚠️ Transaction of a connected client wasn't committed and was rolled back.")
+            writer.close()
+        self.connections.clear()
+
+    async def serve(self, address: str) -> None:
+        if address.startswith("unix:"):
+            path = address[len("unix:"):]
+            if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+                os.remove(path) # socket left by a previous run
+            server = await asyncio.start_unix_server(self.handle_client, path=path)
+        else:
+            host, _, port = address.rpartition(":")
+            server = await asyncio.start_server(self.handle_client, host or None, int(port or DEFAULT_SERVER_PORT))
+        addresses = ', '.join(str(sock.getsockname()) for sock in server.sockets)
+        print(f"Assistant bot is serving the address book on {addresses}. Press Ctrl+C to stop.")
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, server.close)
+        except (NotImplementedError, AttributeError):
+            pass # no SIGTERM handling on Windows
+        async with server:
+            try:
+                await server.serve_forever()
+            except asyncio.CancelledError:
+                print("Server was stopped.")
+            finally:
+                self.close_connections()
+
 def main() -> None:
-    address_book = load_data(ADDRESS_BOOK_FILE_NAME)
+    args = parse_cmd_args()
+    load_plugins(args.plugin)
+    storage = STORAGE_BACKENDS[args.storage]()
+    try:
+        address_book = storage.load()
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+
+    if args.import_path or args.export_path:
+        # Non-interactive mode
+        if args.import_path:
+            with address_book.command_context():
+                print(import_file([args.import_path], address_book))
+            storage.save(address_book)
+        if args.export_path:
+            print(export_file([args.export_path], address_book))
+        return
+
+    history = History(address_book)
+
+    def rollback_open_transaction() -> None:
+        # Like in a database, changes of a transaction that wasn't committed are not kept
+        with address_book.lock, address_book.command_context():
+            if history.in_transaction:
+                history.rollback()
+                print("⚠️ Transaction wasn't committed and was rolled back.")
+
+    if args.batch:
+        # Batch mode: the book is saved once, after all commands are executed
+        if args.batch == "-":
+            run_batch(sys.stdin, address_book)
+        else:
+            try:
+                with open(args.batch, "r", encoding="utf-8") as commands_file:
+                    run_batch(commands_file, address_book)
+            except OSError as e:
+                print(f"❌ Can't read the commands file '{args.batch}': {e.strerror}", file=sys.stderr)
+                sys.exit(1)
+        rollback_open_transaction()
+        storage.save(address_book)
+        return
+
+    # Long-running modes save the book in the background as well
+    autosaver = None
+    if args.autosave > 0:
+        autosaver = AutoSaver(storage, address_book, args.autosave, args.autosave_changes)
+        autosaver.start()
+
+    def save_on_exit() -> None:
+        if autosaver:
+            autosaver.stop()
+        rollback_open_transaction()
+        storage.save(address_book) # only the changes made after the last autosave are left
+
+    if args.serve:
+        try:
+            asyncio.run(BookServer(address_book).serve(args.serve))
+        except KeyboardInterrupt:
+            print("\nServer was stopped by user (Ctrl+C).")
+        except (OSError, ValueError) as e:
+            print(f"❌ Can't start the server on '{args.serve}': {e}", file=sys.stderr)
+        finally:
+            save_on_exit()
+            print("Address book saved. Good bye!")
+        return
 
     print("Welcome to the assistant bot!")
 
@@ -229,33 +2128,22 @@ def main() -> None:
             command, *args = parse_input(user_input)
 
             if command in ["close", "exit"]:
-                save_data(address_book, ADDRESS_BOOK_FILE_NAME)
+                save_on_exit()
                 print("Address book saved. Good bye!")
                 break
 
-            elif command == "hello":
-                print("How can I help you?")
-            elif command == "add":
-                print(add_contact(args, address_book))
-            elif command == "change":
-                print(change_contact(args, address_book))
-            elif command == "phone":
-                print(show_phones(args, address_book))
-            elif command == "all":
-                print_all_contacts(address_book)
-            elif command == "add-birthday":
-                print(add_birthday(args, address_book))
-            elif command == "show-birthday":
-                print(show_birthday(args, address_book))
-            elif command == "birthdays":
-                print_upcoming_birthdays(address_book)
-            else:
-                print("❌ Invalid or empty command!")
+            result = run_command(command, args, address_book)
+            try:
+                for output_line in result_lines(result):
+                    print(output_line)
+            finally:
+                if not isinstance(result, str):
+                    result.close() # e.g. Ctrl+C while printing, the stream releases the book lock
 
     except KeyboardInterrupt:
         print("\nAssistant bot was interrupted by user (Ctrl+C).")
-        print(f"Saving Address book state to the file: {ADDRESS_BOOK_FILE_NAME}")
-        save_data(address_book, ADDRESS_BOOK_FILE_NAME)
+        print(f"Saving Address book state to the file: {storage.filename}")
+        save_on_exit()
         sys.exit(0) # Exit gracefully after saving
 
 if __name__ == "__main__":
@@ -0,0 +1,82 @@
+import os
+import pickle
+import sys
+import tracemalloc
+from datetime import date
+from typing import Final
+
+# Make the bot importable when the benchmark is started from any directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from assistant_bot_v5 import AddressBook, Record
+
+NUMBER_OF_CONTACTS: Final[int] = 100_000
+PHONES_PER_CONTACT: Final[int] = 2
+
+
+class LegacyField:
+    """
+    Field layout used before Record got __slots__: every value is an object with its own __dict__.
+    """
+    def __init__(self, value):
+        self.value = value
+
+
+class LegacyRecord:
+    def __init__(self, name: str):
+        self.name = LegacyField(name)
+        self.phones = []
+        self.birthday = None
+
+
+def build_legacy_book(size: int) -> dict:
+    book = {}
+    for i in range(size):
+        record = LegacyRecord(f"Contact{i}")
+        for j in range(PHONES_PER_CONTACT):
+            record.phones.append(LegacyField(f"{(i * PHONES_PER_CONTACT + j) % 10**10:010d}"))
+        if i % 2:
+            record.birthday = LegacyField(date(1990, i % 12 + 1, i % 28 + 1))
+        book[record.name.value] = record
+    return book
+
+
+def build_compact_book(size: int) -> AddressBook:
+    book = AddressBook()
+    for i in range(size):
+        record = Record(f"Contact{i}")
+        for j in range(PHONES_PER_CONTACT):
+            record.add_phone(f"{(i * PHONES_PER_CONTACT + j) % 10**10:010d}")
+        if i % 2:
+            record.add_birthday(f"{i % 28 + 1:02d}.{i % 12 + 1:02d}.1990")
+        book.add_record(record)
+    return book
+
+
+def measure(builder, size: int) -> tuple[int, int]:
+    """
+    Returns the memory retained by the built book and the size of its pickle, in bytes.
+    """
+    tracemalloc.start()
+    book = builder(size)
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return retained, len(pickle.dumps(book, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def main() -> None:
+    print(f"Building {NUMBER_OF_CONTACTS} contacts with {PHONES_PER_CONTACT} phones each...\n")
+    legacy_memory, legacy_pickle = measure(build_legacy_book, NUMBER_OF_CONTACTS)
+    compact_memory, compact_pickle = measure(build_compact_book, NUMBER_OF_CONTACTS)
+
+    print(f"{'Layout':<10} | {'Memory, MB':>10} | {'Bytes/contact':>13} | {'Pickle, MB':>10}")
+    print("-" * 53)
+    for layout, memory, pickle_size in (("legacy", legacy_memory, legacy_pickle),
+                                        ("compact", compact_memory, compact_pickle)):
+        print(f"{layout:<10} | {memory / 2**20:>10.1f} | {memory // NUMBER_OF_CONTACTS:>13} | {pickle_size / 2**20:>10.1f}")
+    print(f"\nMemory saved: {100 * (1 - compact_memory / legacy_memory):.0f}%, "
+          f"pickle size saved: {100 * (1 - compact_pickle / legacy_pickle):.0f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import os
+import pickle
+import sys
+import tempfile
+import time
+from typing import Final
+
+# Make the bot importable when the benchmark is started from any directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from assistant_bot_v5 import AddressBook, Record, load_data, save_data
+
+NUMBER_OF_CONTACTS: Final[int] = 200_000
+PHONES_PER_CONTACT: Final[int] = 2
+REPEATS: Final[int] = 3
+
+
+def build_book(size: int) -> AddressBook:
+    book = AddressBook()
+    for i in range(size):
+        record = Record(f"Contact{i}")
+        for j in range(PHONES_PER_CONTACT):
+            record.add_phone(f"{(i * PHONES_PER_CONTACT + j) % 10**10:010d}")
+        if i % 2:
+            record.add_birthday(f"{i % 28 + 1:02d}.{i % 12 + 1:02d}.1990")
+        book.add_record(record)
+    return book
+
+
+def best_time(func) -> float:
+    """
+    Runs the function REPEATS times and returns the fastest run in seconds.
+    """
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def pickle_save(book: AddressBook, filename: str) -> None:
+    with open(filename, "wb") as f:
+        pickle.dump(book, f)
+
+
+def pickle_load(filename: str) -> AddressBook:
+    with open(filename, "rb") as f:
+        return pickle.load(f)
+
+
+def main() -> None:
+    print(f"Building {NUMBER_OF_CONTACTS} contacts with {PHONES_PER_CONTACT} phones each...\n")
+    book = build_book(NUMBER_OF_CONTACTS)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        pickle_file = os.path.join(temp_dir, "addressbook.pkl")
+        binary_file = os.path.join(temp_dir, "addressbook.bin")
+        missing_legacy_file = os.path.join(temp_dir, "missing.pkl")
+
+        results = [
+            ("pickle",
+             best_time(lambda: pickle_save(book, pickle_file)),
+             best_time(lambda: pickle_load(pickle_file)),
+             os.path.getsize(pickle_file)),
+            ("binary",
+             best_time(lambda: save_data(book, binary_file)),
+             best_time(lambda: load_data(binary_file, missing_legacy_file)),
+             os.path.getsize(binary_file)),
+        ]
+
+    print(f"{'Format':<8} | {'Save, s':>8} | {'Load, s':>8} | {'Size, MB':>8}")
+    print("-" * 42)
+    for file_format, save_time, load_time, size in results:
+        print(f"{file_format:<8} | {save_time:>8.3f} | {load_time:>8.3f} | {size / 2**20:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()